@@ -6,18 +6,91 @@ specification.md, graph.md, and architecture.md.
 from __future__ import annotations
 
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from utils.llm import chat, chat_json
+import config
+from utils.llm import chat, chat_json, count_tokens, submit_warmed
 from utils.repo_scanner import scan_repo, build_tree_string, build_file_summary
 
 log = logging.getLogger(__name__)
 
+# ── System prompts ────────────────────────────────────────────────────
 
-def analyze_repo(repo_path: str) -> dict:
+_SPEC_DOC = (
+    "a comprehensive SPECIFICATION.md document. Include:\n"
+    "- Project overview and purpose\n"
+    "- Functional requirements (table with IDs)\n"
+    "- Data models and schemas\n"
+    "- API contracts (endpoints, request/response)\n"
+    "- Agent behaviors and responsibilities\n"
+    "- Guardrails and safety rules\n"
+    "- Acceptance criteria\n"
+    "Use proper markdown formatting with tables, headers, and code blocks."
+)
+
+_GRAPH_DOC = (
+    "a GRAPH.md document that shows the system's relationships using Mermaid diagrams. Include:\n"
+    "- Component dependency graph (which modules import which)\n"
+    "- Data flow diagram (how data moves through the system)\n"
+    "- Agent interaction sequence diagram\n"
+    "- Parallel execution flow diagram\n"
+    "- API request flow diagram\n"
+    "Use ```mermaid code blocks for all diagrams. Add explanatory text between diagrams."
+)
+
+_ARCH_DOC = (
+    "an ARCHITECTURE.md document. Include:\n"
+    "- System overview and layer diagram (ASCII art)\n"
+    "- Component descriptions and responsibilities\n"
+    "- Parallel execution strategy and thread pool design\n"
+    "- Data layer design\n"
+    "- External dependencies and integration points\n"
+    "- Security considerations\n"
+    "- Scalability path\n"
+    "- Error handling strategy\n"
+    "Use proper markdown with tables, code blocks, and ASCII diagrams."
+)
+
+SPEC_SYSTEM = (
+    "You are a senior technical writer. Given the repository's structure and code above, "
+    "produce " + _SPEC_DOC
+)
+
+GRAPH_SYSTEM = (
+    "You are a software architect. Given the repository's code above, produce " + _GRAPH_DOC
+)
+
+ARCH_SYSTEM = (
+    "You are a principal engineer. Given the repository's code above, produce " + _ARCH_DOC
+)
+
+COMBINED_SYSTEM = (
+    "You are a principal engineer and senior technical writer. Given the repository's "
+    "structure and code above, produce three documentation files.\n\n"
+    'Respond with JSON: {"specification": "...markdown...", "graph": "...markdown...", '
+    '"architecture": "...markdown..."}\n\n'
+    "## specification\nWrite " + _SPEC_DOC + "\n\n"
+    "## graph\nWrite " + _GRAPH_DOC + "\n\n"
+    "## architecture\nWrite " + _ARCH_DOC
+)
+
+_DOC_KEYS = ["specification", "graph", "architecture"]
+
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {key: {"type": "string"} for key in _DOC_KEYS},
+    "required": _DOC_KEYS,
+    "additionalProperties": False,
+}
+
+
+def analyze_repo(repo_path: str, scan: dict | None = None) -> dict:
     """
     Scan the repo and produce three documentation artifacts.
 
+    Pass `scan` (a scan_repo() result) to reuse a scan the caller already has.
+
     Returns:
         {
             "specification": "...",
@@ -27,75 +100,99 @@ def analyze_repo(repo_path: str) -> dict:
         }
     """
     log.info("Analyzing repository: %s", repo_path)
-    scan = scan_repo(repo_path)
+    if scan is None:
+        scan = scan_repo(repo_path)
     tree_str = build_tree_string(scan["tree"])
-    file_summary = build_file_summary(scan["files"])
-
-    context = (
-        f"## Repository Structure\n```\n{tree_str}\n```\n\n"
-        f"## Repository Stats\n{scan['stats']}\n\n"
-        f"## File Contents\n{file_summary}"
-    )
-
-    # ── Generate specification.md ──
-    log.info("Generating specification.md")
-    specification = chat(
-        system=(
-            "You are a senior technical writer. Given a repository's structure and code, "
-            "produce a comprehensive SPECIFICATION.md document. Include:\n"
-            "- Project overview and purpose\n"
-            "- Functional requirements (table with IDs)\n"
-            "- Data models and schemas\n"
-            "- API contracts (endpoints, request/response)\n"
-            "- Agent behaviors and responsibilities\n"
-            "- Guardrails and safety rules\n"
-            "- Acceptance criteria\n"
-            "Use proper markdown formatting with tables, headers, and code blocks."
-        ),
-        user=f"Analyze this repository and generate a complete specification document:\n\n{context}",
-        max_tokens=8192,
-    )
-
-    # ── Generate graph.md ──
-    log.info("Generating graph.md")
-    graph = chat(
-        system=(
-            "You are a software architect. Given a repository's code, produce a GRAPH.md document "
-            "that shows the system's relationships using Mermaid diagrams. Include:\n"
-            "- Component dependency graph (which modules import which)\n"
-            "- Data flow diagram (how data moves through the system)\n"
-            "- Agent interaction sequence diagram\n"
-            "- Parallel execution flow diagram\n"
-            "- API request flow diagram\n"
-            "Use ```mermaid code blocks for all diagrams. Add explanatory text between diagrams."
-        ),
-        user=f"Analyze this repository and generate comprehensive Mermaid diagrams:\n\n{context}",
-        max_tokens=8192,
-    )
-
-    # ── Generate architecture.md ──
-    log.info("Generating architecture.md")
-    architecture = chat(
-        system=(
-            "You are a principal engineer. Given a repository's code, produce an ARCHITECTURE.md "
-            "document. Include:\n"
-            "- System overview and layer diagram (ASCII art)\n"
-            "- Component descriptions and responsibilities\n"
-            "- Parallel execution strategy and thread pool design\n"
-            "- Data layer design\n"
-            "- External dependencies and integration points\n"
-            "- Security considerations\n"
-            "- Scalability path\n"
-            "- Error handling strategy\n"
-            "Use proper markdown with tables, code blocks, and ASCII diagrams."
-        ),
-        user=f"Analyze this repository and generate a complete architecture document:\n\n{context}",
-        max_tokens=8192,
-    )
+    context = _fit_context(scan, tree_str, config.MAX_CONTEXT_TOKENS)
+
+    # Generate all three documents in a single structured call so the repo
+    # context is sent (and billed) once.
+    docs = _analyze_combined(context)
+    missing = [key for key in _DOC_KEYS if not docs.get(key)]
+    if missing:
+        log.warning("Combined analysis missing %s — generating individually", ", ".join(missing))
+        docs.update(_analyze_separately(context, missing))
 
     return {
-        "specification": specification,
-        "graph": graph,
-        "architecture": architecture,
+        "specification": docs["specification"],
+        "graph": docs["graph"],
+        "architecture": docs["architecture"],
         "stats": scan["stats"],
     }
+
+
+def _fit_context(scan: dict, tree_str: str, budget: int) -> str:
+    """Build the shared repo context, shrinking the file summary to fit a token budget.
+
+    build_file_summary already orders files by importance, so lowering its
+    character budget drops the least important files first.
+    """
+    max_chars = config.MAX_CONTEXT_CHARS
+    while True:
+        file_summary = build_file_summary(scan["files"], max_chars=max_chars)
+        context = (
+            f"## Repository Structure\n```\n{tree_str}\n```\n\n"
+            f"## Repository Stats\n{scan['stats']}\n\n"
+            f"## File Contents\n{file_summary}"
+        )
+        tokens = count_tokens(context)
+        if tokens <= budget or max_chars <= 1_000:
+            return context
+        # Shrink proportionally to the overshoot, with a margin so it converges
+        max_chars = max(1_000, int(max_chars * budget / tokens * 0.95))
+        log.info("Context is %d tokens (budget %d) — trimming file summary to %d chars",
+                 tokens, budget, max_chars)
+
+
+def _analyze_combined(context: str) -> dict[str, str]:
+    """Generate all three documents in one structured-output request."""
+    log.info("Generating specification.md, graph.md, architecture.md")
+    try:
+        result = chat_json(
+            system=COMBINED_SYSTEM,
+            user="Analyze this repository and generate all three documents.",
+            max_tokens=24576,
+            cache_segments=[context],
+            schema=COMBINED_SCHEMA,
+            schema_name="analysis_docs",
+        )
+    except Exception as e:
+        log.error("Combined analysis failed: %s", e)
+        return {}
+    return {key: result[key] for key in _DOC_KEYS if isinstance(result.get(key), str)}
+
+
+def _analyze_separately(context: str, keys: list[str]) -> dict[str, str]:
+    """Generate documents with one request each, run concurrently.
+
+    All requests share the repo context as a leading cached segment; the
+    first is given a short head start so the others hit the warm cache.
+    """
+    prompts = {
+        "specification": {
+            "system": SPEC_SYSTEM,
+            "user": "Analyze this repository and generate a complete specification document.",
+        },
+        "graph": {
+            "system": GRAPH_SYSTEM,
+            "user": "Analyze this repository and generate comprehensive Mermaid diagrams.",
+        },
+        "architecture": {
+            "system": ARCH_SYSTEM,
+            "user": "Analyze this repository and generate a complete architecture document.",
+        },
+    }
+
+    docs: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=len(keys)) as ex:
+        calls = [(key, {**prompts[key], "max_tokens": 8192, "cache_segments": [context]}) for key in keys]
+        futs = dict(zip(submit_warmed(ex, _run, calls), keys))
+        for fut in as_completed(futs):
+            docs[futs[fut]] = fut.result()
+    return docs
+
+
+def _run(name: str, prompt: dict) -> str:
+    """Generate a single documentation artifact."""
+    log.info("Generating %s.md", name)
+    return chat(**prompt)
@@ -5,105 +5,372 @@ the actual code modifications, then applies them to the codebase.
 
 from __future__ import annotations
 
+import functools
+import json
 import logging
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
-from utils.llm import chat_json, chat
+import config
+from utils.llm import chat_json, chat, count_tokens
+from utils.patch import PatchError, apply_patch
 from utils.repo_scanner import scan_repo
 
 log = logging.getLogger(__name__)
 
+# ── System prompts ────────────────────────────────────────────────────
+
+_MODIFY_RULES = (
+    "- Preserve all existing functionality\n"
+    "- Follow the existing code style\n"
+    "- Add imports at the top if needed\n"
+    "- Do not remove or weaken existing features"
+)
+
+NEW_FILE_SYSTEM = (
+    "You are a senior Python developer. Generate the complete file content "
+    "for a new file to be added to the codebase. Return ONLY the file content, "
+    "no markdown fences or explanation. The code must be production-quality, "
+    "well-documented, and follow the existing codebase conventions."
+)
+
+PATCH_SYSTEM = (
+    "You are a senior Python developer. Given an existing file and a requested "
+    "improvement, produce a unified diff that applies the improvement.\n\n"
+    'Respond with JSON: {"patch": "...unified diff...", '
+    '"summary": "brief description of changes"}\n\n'
+    "IMPORTANT:\n"
+    "- Use standard unified diff hunks (@@ -a,b +c,d @@) with 3 lines of context\n"
+    "- Context and removed lines must match the current file exactly\n"
+    '- Use an empty "patch" if no changes are needed\n'
+) + _MODIFY_RULES
+
+MODIFY_SYSTEM = (
+    "You are a senior Python developer. Given an existing file and a requested "
+    "improvement, produce the modified file content.\n\n"
+    'Respond with JSON: {"new_content": "...full file content...", '
+    '"summary": "brief description of changes"}\n\n'
+    "IMPORTANT:\n"
+    "- Return the COMPLETE file content (not a diff)\n"
+) + _MODIFY_RULES
+
+BATCH_MODIFY_SYSTEM = (
+    "You are a senior Python developer. Given several existing files, each with a "
+    "requested improvement, produce the modified content of every file.\n\n"
+    'Respond with JSON: {"results": [{"file": "path", '
+    '"new_content": "...full file content...", '
+    '"summary": "brief description of changes"}, ...]}\n\n'
+    "IMPORTANT:\n"
+    "- Return one result per input file, using the same file path\n"
+    "- Return the COMPLETE file content (not a diff)\n"
+) + _MODIFY_RULES
+
+
+# Multi-file modification batching (~4 chars per token). Keeping each batch
+# under ~12k input tokens stays clear of the diminishing-returns zone where
+# output quality drops; files above the threshold are always sent alone.
+BATCH_MAX_CHARS = 48_000
+BATCH_MAX_FILES = 8
+BATCH_FILE_THRESHOLD = 16_000
+
 
 def execute_changes(repo_path: str, improvements: list[dict]) -> list[dict]:
     """
     For each improvement, generate concrete code changes and apply them.
 
+    Modifications to existing files are batched into multi-file LLM requests.
+    Changes are scheduled in waves where each file appears at most once, so
+    several changes to the same file still apply in order; work within a wave
+    runs concurrently, bounded by config.LLM_CONCURRENCY.
+
     Returns:
         List of applied changes:
         [{"improvement_id": "...", "file": "...", "status": "applied|failed", "diff_summary": "..."}]
     """
     log.info("Executing %d improvements on %s", len(improvements), repo_path)
     repo = Path(repo_path)
-    applied = []
 
+    tasks: list[tuple[dict, dict]] = []
     for imp in improvements:
-        imp_id = imp["id"]
-        log.info("Executing %s: %s", imp_id, imp["title"])
-
+        log.info("Executing %s: %s", imp["id"], imp["title"])
         for change in imp.get("changes", []):
-            target_file = change.get("file", "")
-            file_path = repo / target_file
-
-            if not file_path.exists():
-                # New file — generate it
-                result = _generate_new_file(imp, change, repo_path)
-                if result:
-                    file_path.parent.mkdir(parents=True, exist_ok=True)
-                    file_path.write_text(result["content"])
-                    applied.append({
-                        "improvement_id": imp_id,
-                        "file": target_file,
-                        "action": "created",
-                        "status": "applied",
-                        "diff_summary": f"New file: {len(result['content'])} chars",
-                    })
-                    log.info("Created new file: %s", target_file)
-                else:
-                    applied.append({
-                        "improvement_id": imp_id,
-                        "file": target_file,
-                        "action": "create",
-                        "status": "failed",
-                        "diff_summary": "Failed to generate file content",
-                    })
-            else:
-                # Existing file — generate modifications
-                original = file_path.read_text()
-                result = _modify_file(imp, change, target_file, original)
-                if result and result.get("new_content"):
-                    new_content = result["new_content"]
-                    if new_content != original:
-                        file_path.write_text(new_content)
-                        applied.append({
-                            "improvement_id": imp_id,
-                            "file": target_file,
-                            "action": "modified",
-                            "status": "applied",
-                            "diff_summary": result.get("summary", "Modified"),
-                        })
-                        log.info("Modified: %s", target_file)
+            tasks.append((imp, change))
+
+    results: list[dict | None] = [None] * len(tasks)
+
+    # Files within a wave are disjoint, so its LLM calls and writes can run
+    # concurrently without per-file locking; waves themselves run in order.
+    # Disk writes go to a background writer so LLM workers move straight on
+    # to their next request; it is flushed before the next wave reads files.
+    writer = _BackgroundWriter()
+    try:
+        with ThreadPoolExecutor(max_workers=config.LLM_CONCURRENCY) as ex:
+            for wave in _plan_waves(tasks):
+                created: dict[Future, int] = {}
+                pending = []
+                for idx in wave:
+                    imp, change = tasks[idx]
+                    target_file = change.get("file", "")
+                    file_path = repo / target_file
+                    if not file_path.exists():
+                        write = functools.partial(writer.submit, idx)
+                        created[ex.submit(_create_file, imp, change, repo_path, file_path, write)] = idx
                     else:
-                        applied.append({
-                            "improvement_id": imp_id,
+                        task = {
+                            "index": idx,
+                            "improvement": imp,
+                            "change": change,
                             "file": target_file,
-                            "action": "modify",
-                            "status": "skipped",
-                            "diff_summary": "No changes needed",
-                        })
-                else:
-                    applied.append({
-                        "improvement_id": imp_id,
-                        "file": target_file,
-                        "action": "modify",
-                        "status": "failed",
-                        "diff_summary": "Failed to generate modifications",
-                    })
+                            "original": file_path.read_text(),
+                        }
+                        direct = _hint_modification(change, task["original"])
+                        if direct:
+                            write = functools.partial(writer.submit, idx)
+                            results[idx] = _apply_modification(repo, task, direct, write)
+                        else:
+                            pending.append(task)
+
+                modified: dict[Future, list[dict]] = {
+                    ex.submit(_process_batch, repo, batch, writer): batch
+                    for batch in _plan_batches(pending)
+                }
 
+                for fut, idx in created.items():
+                    results[idx] = fut.result()
+                for fut, batch in modified.items():
+                    for task, record in zip(batch, fut.result()):
+                        results[task["index"]] = record
+
+                writer.flush()
+                for idx, error in writer.pop_errors().items():
+                    results[idx] = {**results[idx], "status": "failed", "diff_summary": f"Write failed: {error}"}
+    finally:
+        writer.close()
+
+    applied = [r for r in results if r is not None]
     applied_count = sum(1 for a in applied if a["status"] == "applied")
     log.info("Applied %d/%d changes successfully", applied_count, len(applied))
     return applied
 
 
+class _BackgroundWriter:
+    """Performs file writes on a single background thread.
+
+    Write errors are collected per task index instead of raised, so the
+    caller can mark the affected change records as failed.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._errors: dict[int, str] = {}
+        self._thread = threading.Thread(target=self._run, name="execute-changes-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, index: int, path: Path, content: str) -> None:
+        self._queue.put((index, path, content))
+
+    def flush(self) -> None:
+        """Block until every queued write has completed."""
+        self._queue.join()
+
+    def pop_errors(self) -> dict[int, str]:
+        errors, self._errors = self._errors, {}
+        return errors
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                index, path, content = item
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_text(content)
+                except OSError as e:
+                    log.error("Failed to write %s: %s", path, e)
+                    self._errors[index] = str(e)
+            finally:
+                self._queue.task_done()
+
+
+def _plan_waves(tasks: list[tuple[dict, dict]]) -> list[list[int]]:
+    """Split task indices into ordered waves in which every file appears at most once."""
+    waves: list[list[int]] = []
+    seen: dict[str, int] = {}  # file → number of tasks already scheduled for it
+    for idx, (_, change) in enumerate(tasks):
+        target_file = change.get("file", "")
+        depth = seen.get(target_file, 0)
+        seen[target_file] = depth + 1
+        if depth == len(waves):
+            waves.append([])
+        waves[depth].append(idx)
+    return waves
+
+
+def _plan_batches(pending: list[dict]) -> list[list[dict]]:
+    """Group modification tasks into batches bounded by size and file count."""
+    batches: list[list[dict]] = []
+    current: list[dict] = []
+    current_chars = 0
+    for task in pending:
+        size = len(task["original"])
+        if size > BATCH_FILE_THRESHOLD:
+            batches.append([task])
+            continue
+        if current and (current_chars + size > BATCH_MAX_CHARS or len(current) >= BATCH_MAX_FILES):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(task)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _process_batch(repo: Path, batch: list[dict], writer: _BackgroundWriter) -> list[dict]:
+    """Generate and apply modifications for one batch, returning change records."""
+    return [
+        _apply_modification(repo, task, result, functools.partial(writer.submit, task["index"]))
+        for task, result in zip(batch, _modify_batch(batch))
+    ]
+
+
+def _modify_batch(batch: list[dict]) -> list[dict | None]:
+    """Modify every file in a batch, falling back to per-file requests for any gaps."""
+    if len(batch) == 1:
+        t = batch[0]
+        return [_modify_file(t["improvement"], t["change"], t["file"], t["original"])]
+
+    by_file = _modify_files_batch(batch)
+    results = []
+    for t in batch:
+        result = by_file.get(t["file"])
+        if not result or not result.get("new_content"):
+            result = _modify_file(t["improvement"], t["change"], t["file"], t["original"])
+        results.append(result)
+    return results
+
+
+def _create_file(
+    imp: dict, change: dict, repo_path: str, file_path: Path, write: Callable[[Path, str], None],
+) -> dict:
+    """Generate a new file and queue its write, returning its change record."""
+    target_file = change.get("file", "")
+    result = _generate_new_file(imp, change, repo_path)
+    if result:
+        write(file_path, result["content"])
+        log.info("Created new file: %s", target_file)
+        return {
+            "improvement_id": imp["id"],
+            "file": target_file,
+            "action": "created",
+            "status": "applied",
+            "diff_summary": f"New file: {len(result['content'])} chars",
+        }
+    return {
+        "improvement_id": imp["id"],
+        "file": target_file,
+        "action": "create",
+        "status": "failed",
+        "diff_summary": "Failed to generate file content",
+    }
+
+
+def _apply_modification(
+    repo: Path, task: dict, result: dict | None, write: Callable[[Path, str], None],
+) -> dict:
+    """Queue a generated modification for writing, returning its change record."""
+    imp_id = task["improvement"]["id"]
+    target_file = task["file"]
+    if result and result.get("new_content"):
+        new_content = result["new_content"]
+        if new_content != task["original"]:
+            write(repo / target_file, new_content)
+            log.info("Modified: %s", target_file)
+            return {
+                "improvement_id": imp_id,
+                "file": target_file,
+                "action": "modified",
+                "status": "applied",
+                "diff_summary": result.get("summary", "Modified"),
+            }
+        return {
+            "improvement_id": imp_id,
+            "file": target_file,
+            "action": "modify",
+            "status": "skipped",
+            "diff_summary": "No changes needed",
+        }
+    return {
+        "improvement_id": imp_id,
+        "file": target_file,
+        "action": "modify",
+        "status": "failed",
+        "diff_summary": "Failed to generate modifications",
+    }
+
+
+# Output budget per request kind: (ratio to input tokens, floor, hard cap).
+# Rewrites echo the file plus the added code; patches are usually smaller.
+# The floors keep the pre-estimate budgets for small files, where an added
+# feature can easily be larger than the file it goes into.
+OUTPUT_BUDGETS = {
+    "patch": (0.6, 4096, 8192),
+    "rewrite": (1.5, 8192, 8192),
+    "batch": (1.5, 8192, 16384),
+}
+
+
+def _estimate_output_tokens(system: str, user: str, kind: str) -> int:
+    """Size max_tokens from the full request rather than a fixed worst case.
+
+    `user` should hold everything sent for the change (file, description and
+    code hint), since the hint's size bounds how much code gets added.
+    """
+    ratio, floor, cap = OUTPUT_BUDGETS[kind]
+    return max(floor, min(cap, int(count_tokens(system + user) * ratio) + 256))
+
+
+def _hint_modification(change: dict, original: str) -> dict | None:
+    """Apply a change's code hint without the LLM when it is safe to do so.
+
+    An existing file is only replaced outright when the change explicitly sets
+    `apply_hint_directly`; otherwise the hint must be a unified diff that
+    applies cleanly. Partial snippets always go through the LLM.
+    """
+    hint = change.get("code_hint") or ""
+    if not hint.strip():
+        return None
+    if change.get("apply_hint_directly"):
+        return {"new_content": hint, "summary": "Applied code hint directly"}
+    if hint.lstrip().startswith(("--- ", "diff ", "@@ ")):
+        try:
+            return {"new_content": apply_patch(original, hint), "summary": "Applied code hint patch"}
+        except PatchError:
+            return None
+    return None
+
+
 def _generate_new_file(improvement: dict, change: dict, repo_path: str) -> dict | None:
-    """Generate content for a new file."""
+    """Generate content for a new file.
+
+    If the change sets `apply_hint_directly`, its code hint is used as-is.
+    """
+    hint = change.get("code_hint") or ""
+    if change.get("apply_hint_directly") and hint.strip():
+        log.info("Using code hint as content for %s", change["file"])
+        return {"content": hint}
     try:
         content = chat(
-            system=(
-                "You are a senior Python developer. Generate the complete file content "
-                "for a new file to be added to the codebase. Return ONLY the file content, "
-                "no markdown fences or explanation. The code must be production-quality, "
-                "well-documented, and follow the existing codebase conventions."
-            ),
+            system=NEW_FILE_SYSTEM,
             user=(
                 f"Create a new file for this improvement:\n\n"
                 f"**Improvement:** {improvement['title']}\n"
@@ -122,32 +389,83 @@ def _generate_new_file(improvement: dict, change: dict, repo_path: str) -> dict
 
 
 def _modify_file(improvement: dict, change: dict, file_path: str, original: str) -> dict | None:
-    """Generate modifications for an existing file."""
+    """Generate modifications for an existing file.
+
+    Asks for a unified diff first, which keeps output tokens proportional to
+    the edit rather than the file. If the patch does not apply cleanly, falls
+    back to requesting the complete file content.
+    """
+    # Built once and sent as the leading segment of both requests, so the
+    # fallback reuses the patch request's cached prompt prefix.
+    request = (
+        f"**Improvement:** {improvement['title']}\n"
+        f"**Description:** {improvement['description']}\n"
+        f"**What to change:** {change['description']}\n"
+        f"**Code hint:** {change.get('code_hint', 'N/A')}\n\n"
+        f"**Current file ({file_path}):**\n```\n{original}\n```"
+    )
     try:
         result = chat_json(
-            system=(
-                "You are a senior Python developer. Given an existing file and a requested "
-                "improvement, produce the modified file content.\n\n"
-                'Respond with JSON: {"new_content": "...full file content...", '
-                '"summary": "brief description of changes"}\n\n'
-                "IMPORTANT:\n"
-                "- Return the COMPLETE file content (not a diff)\n"
-                "- Preserve all existing functionality\n"
-                "- Follow the existing code style\n"
-                "- Add imports at the top if needed\n"
-                "- Do not remove or weaken existing features"
-            ),
-            user=(
-                f"Modify this file for the improvement:\n\n"
-                f"**Improvement:** {improvement['title']}\n"
-                f"**Description:** {improvement['description']}\n"
-                f"**What to change:** {change['description']}\n"
-                f"**Code hint:** {change.get('code_hint', 'N/A')}\n\n"
-                f"**Current file ({file_path}):**\n```\n{original}\n```"
-            ),
-            max_tokens=8192,
+            system=PATCH_SYSTEM,
+            user="Write a patch for the file above for the improvement.",
+            max_tokens=_estimate_output_tokens(PATCH_SYSTEM, request, "patch"),
+            cache_segments=[request],
+        )
+        if "patch" in result:
+            summary = result.get("summary", "Modified")
+            if not result["patch"].strip():
+                return {"new_content": original, "summary": summary}
+            try:
+                return {"new_content": apply_patch(original, result["patch"]), "summary": summary}
+            except PatchError as e:
+                log.warning("Patch for %s did not apply (%s) — requesting full content", file_path, e)
+    except Exception as e:
+        log.warning("Patch generation failed for %s: %s — requesting full content", file_path, e)
+
+    try:
+        return chat_json(
+            system=MODIFY_SYSTEM,
+            user="Modify the file above for the improvement.",
+            max_tokens=_estimate_output_tokens(MODIFY_SYSTEM, request, "rewrite"),
+            cache_segments=[request],
         )
-        return result
     except Exception as e:
         log.error("Failed to modify %s: %s", file_path, e)
         return None
+
+
+def _modify_files_batch(tasks: list[dict]) -> dict[str, dict]:
+    """Generate modifications for several existing files in one request.
+
+    Returns a mapping of file path → {"new_content": ..., "summary": ...}.
+    Files missing from the response are absent from the mapping.
+    """
+    payload = [
+        {
+            "file": t["file"],
+            "improvement": t["improvement"]["title"],
+            "description": t["change"]["description"],
+            "code_hint": t["change"].get("code_hint", "N/A"),
+            "original": t["original"],
+        }
+        for t in tasks
+    ]
+    user = (
+        "Modify these files for their improvements:\n\n"
+        f"```json\n{json.dumps(payload, indent=2)}\n```"
+    )
+    try:
+        result = chat_json(
+            system=BATCH_MODIFY_SYSTEM,
+            user=user,
+            max_tokens=_estimate_output_tokens(BATCH_MODIFY_SYSTEM, user, "batch"),
+        )
+    except Exception as e:
+        log.error("Failed to modify batch of %d files: %s", len(tasks), e)
+        return {}
+
+    return {
+        r["file"]: r
+        for r in result.get("results", [])
+        if isinstance(r, dict) and r.get("file")
+    }
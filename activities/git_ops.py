@@ -9,6 +9,7 @@ import subprocess
 from pathlib import Path
 
 import config
+from utils import git_backend
 
 log = logging.getLogger(__name__)
 
@@ -16,18 +17,27 @@ log = logging.getLogger(__name__)
 def create_branch(repo_path: str, branch_name: str) -> dict:
     """Create and checkout a new branch."""
     log.info("Creating branch: %s", branch_name)
-    _git(repo_path, "checkout", "-b", branch_name)
+    if git_backend.AVAILABLE:
+        git_backend.create_branch(repo_path, branch_name)
+    else:
+        _git(repo_path, "checkout", "-b", branch_name)
     return {"branch": branch_name, "status": "created"}
 
 
 def commit_changes(repo_path: str, message: str) -> dict:
     """Stage all changes and commit."""
     log.info("Committing: %s", message)
+    if git_backend.AVAILABLE:
+        sha = git_backend.commit_all(repo_path, message)
+        if sha is None:
+            log.info("Nothing to commit")
+            return {"status": "nothing_to_commit", "message": message}
+        return {"status": "committed", "message": message, "sha": sha}
+
     _git(repo_path, "add", "-A")
 
     # Check if there's anything to commit
-    result = _git(repo_path, "status", "--porcelain")
-    if not result.strip():
+    if not _has_changes(repo_path):
         log.info("Nothing to commit")
         return {"status": "nothing_to_commit", "message": message}
 
@@ -72,8 +82,14 @@ def create_merge_request(repo_path: str, branch_name: str, title: str, body: str
         return {"status": "failed", "error": str(e)}
 
 
-def auto_merge(repo_path: str, review_score: float, threshold: float | None = None) -> dict:
-    """Merge the PR if the review score meets the threshold."""
+def auto_merge(
+    repo_path: str, review_score: float, threshold: float | None = None, pr_url: str | None = None,
+) -> dict:
+    """Merge the PR if the review score meets the threshold.
+
+    Pass the `pr_url` returned by create_merge_request so gh merges that PR
+    directly instead of looking it up from the current branch.
+    """
     threshold = threshold or config.AUTO_MERGE_THRESHOLD
     log.info("Auto-merge check: score=%.1f, threshold=%.1f", review_score, threshold)
 
@@ -89,7 +105,7 @@ def auto_merge(repo_path: str, review_score: float, threshold: float | None = No
     # Merge via gh CLI
     try:
         output = subprocess.run(
-            ["gh", "pr", "merge", "--merge", "--delete-branch"],
+            ["gh", "pr", "merge", *([pr_url] if pr_url else []), "--merge", "--delete-branch"],
             capture_output=True,
             text=True,
             cwd=repo_path,
@@ -107,8 +123,17 @@ def auto_merge(repo_path: str, review_score: float, threshold: float | None = No
 
 
 def checkout_main(repo_path: str) -> dict:
-    """Switch back to main and pull latest."""
-    _git(repo_path, "checkout", "main")
+    """Switch back to main and pull latest.
+
+    With pygit2 the current branch is read in-process, and the checkout is
+    skipped when main is already checked out. The pull always runs, since
+    it brings in the merge.
+    """
+    if git_backend.AVAILABLE:
+        if git_backend.current_branch(repo_path) != "main":
+            git_backend.checkout(repo_path, "main")
+    else:
+        _git(repo_path, "checkout", "main")
     _git(repo_path, "pull", "origin", "main")
     return {"status": "on_main"}
 
@@ -125,3 +150,21 @@ def _git(repo_path: str, *args: str) -> str:
     if result.returncode != 0 and "nothing to commit" not in result.stdout:
         log.warning("git %s failed: %s", " ".join(args), result.stderr)
     return result.stdout + result.stderr
+
+
+def _has_changes(repo_path: str) -> bool:
+    """Return True as soon as `git status --porcelain` reports a path.
+
+    Streams the output and stops at the first line instead of buffering the
+    full listing, which can be large after repo-wide changes.
+    """
+    with subprocess.Popen(
+        ["git", "status", "--porcelain"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=repo_path,
+    ) as proc:
+        first = proc.stdout.readline()
+        if proc.poll() is None:
+            proc.kill()
+    return bool(first.strip())
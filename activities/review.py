@@ -5,14 +5,58 @@ produces a scored assessment.
 
 from __future__ import annotations
 
+import io
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from utils.llm import chat_json
-from utils.repo_scanner import scan_repo, build_file_summary
 
 log = logging.getLogger(__name__)
 
+# Characters of each changed file shown to the reviewer
+REVIEW_FILE_CHARS = 3000
+REVIEW_READ_WORKERS = 16
+# Hard cap on the total changes context sent to the reviewer
+REVIEW_MAX_CHARS = 40_000
+
+_SCORE_DIMENSIONS = [
+    "code_quality", "features", "security", "compliance", "integration", "test_coverage_potential",
+]
+
+# Structured-output schema for the review response (strict mode: every
+# property required, no additional properties)
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_score": {"type": "number"},
+        "scores": {
+            "type": "object",
+            "properties": {dim: {"type": "number"} for dim in _SCORE_DIMENSIONS},
+            "required": _SCORE_DIMENSIONS,
+            "additionalProperties": False,
+        },
+        "issues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "severity": {"type": "string", "enum": ["critical", "high", "medium", "low"]},
+                    "file": {"type": "string"},
+                    "line": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["severity", "file", "line", "description"],
+                "additionalProperties": False,
+            },
+        },
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "summary": {"type": "string"},
+    },
+    "required": ["overall_score", "scores", "issues", "strengths", "summary"],
+    "additionalProperties": False,
+}
+
 
 def review_changes(repo_path: str, applied_changes: list[dict]) -> dict:
     """
@@ -28,30 +72,46 @@ def review_changes(repo_path: str, applied_changes: list[dict]) -> dict:
         }
     """
     log.info("Reviewing %d applied changes", len(applied_changes))
-    scan = scan_repo(repo_path)
 
-    # Build context of what changed
-    changes_context = []
+    # Pick the files that fit under the context cap *before* reading them, so
+    # nothing is read only to be truncated away. Sizes come from stat(); the
+    # reads themselves are independent and run concurrently.
+    selected: list[tuple[str, Path]] = []
+    total = 0
+    truncated = False
     for change in applied_changes:
         if change["status"] != "applied":
             continue
         file_path = Path(repo_path) / change["file"]
-        if file_path.exists():
-            content = file_path.read_text(errors="replace")
-            changes_context.append(
-                f"### {change['file']} ({change['action']})\n"
-                f"Improvement: {change['improvement_id']}\n"
-                f"Summary: {change['diff_summary']}\n"
-                f"```\n{content[:3000]}\n```"
-            )
-
-    changes_text = "\n\n".join(changes_context)
-    # Hard cap: keep changes under 40k chars total
-    if len(changes_text) > 40_000:
-        changes_text = changes_text[:40_000] + "\n\n... [TRUNCATED — too many changes to show all]"
-
-    # Skip full file summary to stay under token limits — changes context is enough
-    file_summary = ""
+        try:
+            size = file_path.stat().st_size
+        except OSError:
+            continue
+        header = (
+            f"### {change['file']} ({change['action']})\n"
+            f"Improvement: {change['improvement_id']}\n"
+            f"Summary: {change['diff_summary']}\n"
+            f"```\n"
+        )
+        total += len(header) + min(REVIEW_FILE_CHARS, size) + 6
+        if total > REVIEW_MAX_CHARS:
+            truncated = True
+            break
+        selected.append((header, file_path))
+
+    with ThreadPoolExecutor(max_workers=REVIEW_READ_WORKERS) as ex:
+        heads = ex.map(lambda path: _read_head(path, REVIEW_FILE_CHARS), [p for _, p in selected])
+
+        buf = io.StringIO()
+        for i, ((header, _), content) in enumerate(zip(selected, heads)):
+            if i:
+                buf.write("\n\n")
+            buf.write(header)
+            buf.write(content)
+            buf.write("\n```")
+    if truncated:
+        buf.write("\n\n... [TRUNCATED — too many changes to show all]")
+    changes_text = buf.getvalue()
 
     result = chat_json(
         system=(
@@ -78,10 +138,13 @@ def review_changes(repo_path: str, applied_changes: list[dict]) -> dict:
         ),
         user=(
             f"Review these code changes:\n\n"
-            f"## Changes Applied\n{changes_text}\n\n"
-            f"## Full Codebase Context\n{file_summary}"
+            f"## Changes Applied\n{changes_text}"
         ),
         max_tokens=4096,
+        schema=REVIEW_SCHEMA,
+        schema_name="code_review",
+        # The score gates auto-merge; always get a fresh review
+        use_cache=False,
     )
 
     # Determine pass/fail
@@ -94,3 +157,14 @@ def review_changes(repo_path: str, applied_changes: list[dict]) -> dict:
         overall, result["passed"], len(result.get("issues", [])),
     )
     return result
+
+
+def _read_head(path: Path, chars: int) -> str:
+    """Read only the first `chars` characters of a file.
+
+    Reads at most 4 bytes per character (the UTF-8 maximum) instead of
+    decoding the whole file, so memory stays bounded for large files.
+    """
+    with open(path, "rb") as f:
+        raw = f.read(chars * 4)
+    return raw.decode("utf-8", errors="replace")[:chars]
@@ -23,15 +23,58 @@ Generates:
 
 from __future__ import annotations
 
+import contextlib
+import functools
 import json
 import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import IO, Callable, Union
 
-from utils.llm import chat, chat_json
+import config
+from utils.llm import CostMeter, chat, chat_json, chat_stream, submit_warmed
 from utils.repo_scanner import scan_repo, build_tree_string, build_file_summary
 
 log = logging.getLogger(__name__)
 
+# A response wrapped in a markdown fence (optionally language-tagged); the
+# closing fence is optional in case the output was cut off.
+_FENCE_RE = re.compile(r"^```[\w+-]*\n(.*?)(?:\n```)?$", re.DOTALL)
+
+# Design docs generated together by one LLM call: path -> (section marker,
+# what to write). Each document is preceded by a `===MARKER===` line in the
+# response, which _SectionWriter uses to route it to its own file.
+DESIGN_DOCS = {
+    "docs/specification.md": (
+        "SPECIFICATION",
+        "a comprehensive specification.md. Include: project overview, functional requirements "
+        "(table with IDs), data models, API contracts, behaviors, guardrails, acceptance criteria.",
+    ),
+    "docs/architecture.md": (
+        "ARCHITECTURE",
+        "architecture.md. Include: system overview, layer diagram, component descriptions, "
+        "data layer, external deps, security, scalability, error handling.",
+    ),
+    "docs/graph.md": (
+        "GRAPH",
+        "graph.md with Mermaid diagrams. Include: component dependency graph, data flow, "
+        "sequence diagrams. Use ```mermaid code blocks.",
+    ),
+}
+DESIGN_DOC_MAX_TOKENS = 6000  # per document
+
+_SECTION_RE = re.compile(r"^===([A-Z]+)===$")
+
+# Dependency manifests and tool configs — all that CI, Makefile and
+# CONTRIBUTING generation need to see of the repo's contents
+CONFIG_EXTS = {".yml", ".yaml", ".toml", ".json", ".cfg", ".ini", ".txt", ".sh"}
+
+# Threads used to write the generated files to disk
+WRITE_WORKERS = 8
+
 # ── Checklist of best-practice files ──────────────────────────────────
 
 CHECKLIST = [
@@ -54,15 +97,27 @@ CHECKLIST = [
     (".github/ISSUE_TEMPLATE/feature_request.md", "ci", "Feature request template"),
 ]
 
+# Checklist paths produced by _generate_docs
+DOC_PATHS = frozenset(
+    rel_path for rel_path, category, _ in CHECKLIST if category == "docs"
+)
+
+
+# Markers that may appear anywhere in a path, matched in one pass over the tree
+_STACK_MARKER_RE = re.compile(
+    r"fastapi|flask|django|next\.config|nextjs|pytest|jest\.config|vitest"
+    r"|\.github/workflows|\.gitlab-ci|jenkinsfile|dockerfile|docker-compose",
+    re.IGNORECASE,
+)
+
 
 def _detect_stack(tree: list[str], files: dict) -> dict:
     """Detect the language, framework, and package manager from repo contents."""
-    extensions = {}
-    for rel, info in files.items():
-        ext = info.get("ext", "")
-        extensions[ext] = extensions.get(ext, 0) + info.get("lines", 0)
+    extensions = {info.get("ext", "") for info in files.values()}
 
-    has = lambda name: any(name in f for f in tree)
+    joined = "\n".join(tree)
+    basenames = {f.rsplit("/", 1)[-1] for f in tree}
+    markers = {m.group().lower() for m in _STACK_MARKER_RE.finditer(joined)}
 
     stack = {
         "languages": [],
@@ -87,74 +142,66 @@ def _detect_stack(tree: list[str], files: dict) -> dict:
         stack["languages"].append("rust")
 
     # Frameworks
-    if has("fastapi") or has("FastAPI"):
+    if "fastapi" in markers:
         stack["frameworks"].append("fastapi")
-    if has("flask"):
+    if "flask" in markers:
         stack["frameworks"].append("flask")
-    if has("django"):
+    if "django" in markers:
         stack["frameworks"].append("django")
-    if has("next.config") or has("nextjs"):
+    if "next.config" in markers or "nextjs" in markers:
         stack["frameworks"].append("nextjs")
-    if has("package.json"):
+    if "package.json" in basenames:
         stack["frameworks"].append("node")
 
     # Package managers
-    if has("pyproject.toml"):
-        stack["package_manager"] = "pyproject.toml"
-    elif has("requirements.txt"):
-        stack["package_manager"] = "requirements.txt"
-    elif has("package.json"):
-        stack["package_manager"] = "package.json"
-    elif has("Cargo.toml"):
-        stack["package_manager"] = "Cargo.toml"
-    elif has("go.mod"):
-        stack["package_manager"] = "go.mod"
+    for manifest in ("pyproject.toml", "requirements.txt", "package.json", "Cargo.toml", "go.mod"):
+        if manifest in basenames:
+            stack["package_manager"] = manifest
+            break
 
     # Tests
-    stack["has_tests"] = any("test" in f.lower() for f in tree)
-    if has("pytest") or has("conftest.py"):
+    stack["has_tests"] = "test" in joined.lower()
+    if "pytest" in markers or "conftest.py" in basenames:
         stack["test_framework"] = "pytest"
-    elif has("jest.config"):
+    elif "jest.config" in markers:
         stack["test_framework"] = "jest"
-    elif has("vitest"):
+    elif "vitest" in markers:
         stack["test_framework"] = "vitest"
 
     # CI
-    stack["has_ci"] = has(".github/workflows") or has(".gitlab-ci") or has("Jenkinsfile")
+    stack["has_ci"] = bool(markers & {".github/workflows", ".gitlab-ci", "jenkinsfile"})
 
     # Docker
-    stack["has_docker"] = has("Dockerfile") or has("docker-compose")
+    stack["has_docker"] = bool(markers & {"dockerfile", "docker-compose"})
 
     return stack
 
 
-def _audit_repo(repo_path: Path, tree: list[str]) -> dict:
-    """Check which best-practice files exist and which are missing."""
+def _audit_repo(tree_set: set[str], files: dict) -> dict:
+    """Check which best-practice files exist and which are missing.
+
+    Works entirely off the scan (tree paths and per-file line counts), so no
+    extra filesystem calls are made.
+    """
     existing = []
     missing = []
 
     for rel_path, category, description in CHECKLIST:
-        full = repo_path / rel_path
-        if full.exists():
-            # Check if README is thin (< 20 lines)
-            if rel_path == "README.md":
-                try:
-                    content = full.read_text()
-                    if content.count("\n") < 20:
-                        missing.append({
-                            "path": rel_path, "category": category,
-                            "description": description, "note": "exists but thin (<20 lines)",
-                        })
-                        continue
-                except Exception:
-                    pass
+        if rel_path in tree_set:
+            # Check if README is thin (< 20 lines; scan_repo counts newlines + 1)
+            info = files.get(rel_path) if rel_path == "README.md" else None
+            if info is not None and info.get("lines", 0) <= 20:
+                missing.append({
+                    "path": rel_path, "category": category,
+                    "description": description, "note": "exists but thin (<20 lines)",
+                })
+                continue
             existing.append({"path": rel_path, "category": category, "description": description})
         else:
             missing.append({"path": rel_path, "category": category, "description": description})
 
     # Check for tests directory structure
-    tests_dir = repo_path / "tests"
-    if not tests_dir.is_dir():
+    if not any(f.startswith("tests/") for f in tree_set):
         missing.append({
             "path": "tests/", "category": "testing",
             "description": "Test directory with unit/integration structure",
@@ -173,6 +220,8 @@ def scaffold_repo(repo_path: str) -> dict:
             "audit": {"existing": [...], "missing": [...]},
             "created": ["path1", "path2", ...],
             "skipped": ["path1", ...],
+            "failed": ["path1", ...],
+            "cost_report": {"calls": int, "prompt_tokens": int, ...},
         }
     """
     repo = Path(repo_path)
@@ -190,64 +239,509 @@ def scaffold_repo(repo_path: str) -> dict:
     log.info("Detected stack: %s", stack)
 
     # Step 3: Audit
-    audit = _audit_repo(repo, tree)
+    audit = _audit_repo(set(tree), files)
     log.info("Audit: %d existing, %d missing", len(audit["existing"]), len(audit["missing"]))
 
     if not audit["missing"]:
         log.info("Repository already has all best-practice files!")
-        return {"stack": stack, "audit": audit, "created": [], "skipped": []}
+        return {
+            "stack": stack, "audit": audit, "created": [], "skipped": [], "failed": [],
+            "cost_report": CostMeter("scaffold").report(),
+        }
 
     # Step 4: Generate missing files via LLM
-    context = (
+    # Two shared contexts: the full one for docs that describe the code, and
+    # a config-only one for tooling. Each stays byte-identical across the
+    # calls that use it, so both remain prompt-cacheable.
+    header = (
         f"## Repository: {repo.name}\n\n"
         f"## Detected Stack\n```json\n{json.dumps(stack, indent=2)}\n```\n\n"
         f"## File Tree\n```\n{tree_str}\n```\n\n"
-        f"## File Contents (sample)\n{file_summary}"
     )
+    context = header + f"## File Contents (sample)\n{file_summary}"
+    config_context = header + f"## Config Files\n{build_file_summary(files, max_chars=30_000, filter_exts=CONFIG_EXTS)}"
+
+    missing_paths = frozenset(m["path"] for m in audit["missing"])
+
+    # Collect every missing artifact; LLM-backed ones are deferred callables
+    artifacts: dict[str | tuple[str, ...], Artifact] = {}
+    artifacts.update(_generate_docs(context, config_context, stack, missing_paths))
+    artifacts.update(_generate_ci(config_context, stack, missing_paths))
+    artifacts.update(_generate_tooling(context, config_context, stack, missing_paths, files))
+    artifacts.update(_generate_templates(context, stack, missing_paths))
+    artifacts.update(_generate_tests_scaffold(context, stack, missing_paths))
+
+    # None of the prompts depend on another artifact's output, so all LLM
+    # calls run concurrently into temp files; a single post-pass moves them
+    # (and writes the static files) into place.
+    with CostMeter("scaffold") as meter:
+        contents, failed = _produce_artifacts(repo, artifacts)
+
+    # Create each target directory once, then write the files in parallel
+    for directory in {(repo / rel_path).parent for rel_path in contents}:
+        directory.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as ex:
+        written = list(ex.map(lambda item: _write_file(repo, *item), contents.items()))
+    created = [rel_path for rel_path, ok in zip(contents, written) if ok]
+    skipped = [rel_path for rel_path, ok in zip(contents, written) if not ok]
+
+    log.info("Scaffolding complete: %d created, %d skipped, %d failed", len(created), len(skipped), len(failed))
+    return {
+        "stack": stack, "audit": audit, "created": created, "skipped": skipped, "failed": failed,
+        "cost_report": meter.report(),
+    }
+
+
+# ── Static templates ──────────────────────────────────────────────────
+#
+# CI, Makefile and test scaffolding barely vary between projects of the same
+# stack, so for Python and Node repos they are rendered from these templates
+# instead of being generated. `{{ name }}` placeholders are filled in by
+# _render_template; GitHub's own `${{ ... }}` expressions are left untouched.
+
+_TEMPLATE_LANGS = {"python", "javascript", "typescript"}
+
+CI_PYTHON = """name: CI
+
+on:
+  push:
+    branches: [main]
+  pull_request:
+
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    strategy:
+      fail-fast: false
+      matrix:
+        python-version: ["3.11", "3.12"]
+    steps:
+      - uses: actions/checkout@v4
+      - uses: actions/setup-python@v5
+        with:
+          python-version: ${{ matrix.python-version }}
+          cache: pip
+      - name: Install dependencies
+        run: |
+          python -m pip install --upgrade pip
+          {{ install }}
+          pip install pytest pytest-cov ruff mypy
+      - name: Lint
+        run: ruff check .
+      - name: Type-check
+        run: mypy . --ignore-missing-imports
+        continue-on-error: true
+      - name: Test
+        run: pytest --cov --cov-report=xml
+"""
+
+CI_NODE = """name: CI
+
+on:
+  push:
+    branches: [main]
+  pull_request:
+
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    strategy:
+      fail-fast: false
+      matrix:
+        node-version: [20, 22]
+    steps:
+      - uses: actions/checkout@v4
+      - uses: actions/setup-node@v4
+        with:
+          node-version: ${{ matrix.node-version }}
+          cache: npm
+      - name: Install dependencies
+        run: npm ci
+      - name: Lint
+        run: npm run lint --if-present
+      - name: Type-check
+        run: npm run typecheck --if-present
+      - name: Test
+        run: npm test --if-present -- --coverage
+"""
+
+MAKEFILE_PYTHON = """.DEFAULT_GOAL := help
+.PHONY: help install test lint format typecheck clean{{ docker_phony }}
+
+help:  ## List available targets
+\t@grep -E '^[a-zA-Z_-]+:.*?## ' $(MAKEFILE_LIST) | awk 'BEGIN {FS = ":.*?## "}; {printf "  %-12s %s\\n", $$1, $$2}'
+
+install:  ## Install dependencies
+\t{{ install }}
+\tpip install pytest pytest-cov ruff mypy
+
+test:  ## Run tests
+\tpytest
 
-    missing_paths = [m["path"] for m in audit["missing"]]
-    created = []
-    skipped = []
+lint:  ## Run linter
+\truff check .
 
-    # Group related files for efficient LLM calls
-    _generate_docs(repo, context, stack, missing_paths, created, skipped)
-    _generate_ci(repo, context, stack, missing_paths, created, skipped)
-    _generate_tooling(repo, context, stack, missing_paths, created, skipped)
-    _generate_templates(repo, context, stack, missing_paths, created, skipped)
-    _generate_tests_scaffold(repo, context, stack, missing_paths, created, skipped)
+format:  ## Format code
+\truff format .
+
+typecheck:  ## Run type checker
+\tmypy . --ignore-missing-imports
+
+clean:  ## Remove build artifacts and caches
+\trm -rf build dist *.egg-info .pytest_cache .mypy_cache .ruff_cache .coverage htmlcov
+\tfind . -type d -name __pycache__ -prune -exec rm -rf {} +
+{{ docker_targets }}"""
+
+MAKEFILE_NODE = """.DEFAULT_GOAL := help
+.PHONY: help install dev test lint format typecheck clean{{ docker_phony }}
+
+help:  ## List available targets
+\t@grep -E '^[a-zA-Z_-]+:.*?## ' $(MAKEFILE_LIST) | awk 'BEGIN {FS = ":.*?## "}; {printf "  %-12s %s\\n", $$1, $$2}'
+
+install:  ## Install dependencies
+\tnpm ci
+
+dev:  ## Start the dev server
+\tnpm run dev
+
+test:  ## Run tests
+\tnpm test
+
+lint:  ## Run linter
+\tnpm run lint
+
+format:  ## Format code
+\tnpx prettier --write .
+
+typecheck:  ## Run type checker
+\tnpm run typecheck --if-present
+
+clean:  ## Remove build artifacts
+\trm -rf dist build coverage node_modules/.cache
+{{ docker_targets }}"""
+
+MAKEFILE_DOCKER_TARGETS = """
+docker-up:  ## Start services with docker compose
+\tdocker compose up -d
+
+docker-down:  ## Stop docker compose services
+\tdocker compose down
+"""
+
+CONFTEST_PYTHON = '''"""Shared pytest fixtures."""
+
+from __future__ import annotations
 
-    log.info("Scaffolding complete: %d created, %d skipped", len(created), len(skipped))
-    return {"stack": stack, "audit": audit, "created": created, "skipped": skipped}
+import pytest
+
+
+@pytest.fixture
+def tmp_workdir(tmp_path, monkeypatch):
+    """Run the test inside an empty temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def env(monkeypatch):
+    """Set environment variables for the duration of a test: env(NAME="value")."""
+    def _set(**values: str) -> None:
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+    return _set
+
+
+@pytest.fixture
+def sample_data() -> dict:
+    """Small, deterministic payload for tests that need input data."""
+    return {"id": 1, "name": "example", "tags": ["a", "b"], "active": True}
+'''
+
+TEST_CORE_PYTHON = '''"""Smoke tests: every project module imports cleanly."""
+
+from __future__ import annotations
+
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+SKIP_DIRS = {"tests", ".git", ".venv", "venv", "build", "dist", "node_modules", "__pycache__"}
+
+
+def _project_modules() -> list[str]:
+    modules = []
+    for path in sorted(ROOT.rglob("*.py")):
+        rel = path.relative_to(ROOT)
+        if any(part in SKIP_DIRS or part.startswith(".") for part in rel.parts[:-1]):
+            continue
+        if rel.name in ("setup.py", "conftest.py"):
+            continue
+        parts = rel.with_suffix("").parts
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        if parts:
+            modules.append(".".join(parts))
+    return modules
+
+
+@pytest.mark.parametrize("module", _project_modules())
+def test_module_imports(module, monkeypatch):
+    monkeypatch.syspath_prepend(str(ROOT))
+    importlib.import_module(module)
+
+
+def test_project_has_modules():
+    assert _project_modules(), "no Python modules found under the project root"
+
+
+def test_python_version():
+    assert sys.version_info >= (3, 9)
+'''
+
+_PYTHON_INSTALL = {
+    "pyproject.toml": "pip install -e .",
+    "requirements.txt": "pip install -r requirements.txt",
+}
+
+# os.getenv("X"), os.environ["X"], os.environ.get("X"), process.env.X, process.env["X"]
+_ENV_VAR_RE = re.compile(
+    r"""(?:os\.getenv|os\.environ\.get|os\.environ\[)\(?\s*["']([A-Z][A-Z0-9_]*)["']"""
+    r"""(?:\s*,\s*["']([^"'\n]*)["'])?"""
+    r"""|process\.env(?:\.([A-Z][A-Z0-9_]*)|\[["']([A-Z][A-Z0-9_]*)["']\])"""
+)
+
+
+def _strip_fence(text: str) -> str:
+    """Remove a wrapping markdown fence from an LLM response; end with one newline."""
+    text = text.strip()
+    m = _FENCE_RE.match(text)
+    return (m.group(1).strip() if m else text) + "\n"
+
+
+def _render_template(template: str, **values: str) -> str:
+    """Fill `{{ name }}` placeholders in a static template."""
+    for name, value in values.items():
+        template = template.replace("{{ %s }}" % name, value)
+    return template
+
+
+def _uses_templates(stack: dict) -> bool:
+    """Static templates apply when the primary language is one we ship them for."""
+    return bool(stack["languages"]) and stack["languages"][0] in _TEMPLATE_LANGS
+
+
+def _makefile_docker(stack: dict) -> dict[str, str]:
+    if not stack["has_docker"]:
+        return {"docker_phony": "", "docker_targets": ""}
+    return {"docker_phony": " docker-up docker-down", "docker_targets": MAKEFILE_DOCKER_TARGETS}
+
+
+def _env_example_from_code(files: dict) -> str | None:
+    """Build .env.example from the environment variables the code reads.
+
+    Returns None if no environment variable reads were found.
+    """
+    found: dict[str, tuple[str, str]] = {}
+    for rel_path, info in files.items():
+        if info["ext"] not in (".py", ".js", ".jsx", ".ts", ".tsx"):
+            continue
+        for m in _ENV_VAR_RE.finditer(info["content"]):
+            name = m.group(1) or m.group(3) or m.group(4)
+            default = m.group(2) or ""
+            if name not in found or (default and not found[name][1]):
+                found[name] = (rel_path, default)
+    if not found:
+        return None
+
+    lines = ["# Copy to .env and fill in the values.", ""]
+    for name in sorted(found):
+        rel_path, default = found[name]
+        lines.append(f"# Used in {rel_path}")
+        lines.append(f"{name}={default}")
+    return "\n".join(lines) + "\n"
 
 
 # ── Generators ────────────────────────────────────────────────────────
+#
+# Each generator returns {rel_path: artifact} for the files it is responsible
+# for (keyed by a tuple of paths when one call produces several). An artifact is either static content or a callable that writes the
+# content (an LLM call) into the sink it is given, so scaffold_repo can run
+# them all concurrently and stream the results to disk.
+
+# Deferred artifacts are called with sink=<file>; those registered under a
+# tuple of paths produce several files and are called with sinks={path: file}.
+Artifact = Union[str, Callable[..., None]]
+
+
+def _produce_artifacts(
+    repo: Path, artifacts: dict[str | tuple[str, ...], Artifact],
+) -> tuple[dict[str, str | Path], list[str]]:
+    """Resolve all artifacts, running deferred LLM calls concurrently.
+
+    Deferred artifacts write into a temp file beside their target, so large
+    documents stream to disk instead of being held in memory.
 
-def _write_file(repo: Path, rel_path: str, content: str, created: list, skipped: list) -> None:
-    """Write a file, creating parent dirs. Skip if it already exists."""
+    Returns (static content or temp file by path in the original order,
+    paths that failed).
+    """
+    contents: dict[str, str | Path | None] = {}
+    deferred: dict[tuple[str, ...], Callable[..., None]] = {}
+    for key, art in artifacts.items():
+        paths = key if isinstance(key, tuple) else (key,)
+        for rel_path in paths:
+            contents[rel_path] = art if isinstance(art, str) else None
+        if not isinstance(art, str):
+            deferred[paths] = art
+
+    failed = []
+    if deferred:
+        # Every call leads with the shared repo context as a cached segment
+        with ThreadPoolExecutor(max_workers=config.LLM_CONCURRENCY) as ex:
+            calls = [(repo, paths, produce) for paths, produce in deferred.items()]
+            futs = dict(zip(submit_warmed(ex, _stream_artifact, calls), deferred))
+            for fut in as_completed(futs):
+                paths = futs[fut]
+                try:
+                    contents.update(fut.result())
+                except Exception as e:
+                    log.error("Failed to generate %s: %s", ", ".join(paths), e)
+                    failed.extend(paths)
+                    continue
+                for rel_path in paths:
+                    if contents[rel_path] is None:
+                        log.error("Failed to generate %s: no content in response", rel_path)
+                        failed.append(rel_path)
+    return {k: v for k, v in contents.items() if v is not None}, failed
+
+
+def _open_file(repo: Path, rel_path: str) -> IO[str]:
+    """Open a temp file in the target's directory; _write_file moves it into place."""
     full = repo / rel_path
-    if full.exists():
-        skipped.append(rel_path)
-        return
     full.parent.mkdir(parents=True, exist_ok=True)
-    full.write_text(content)
-    created.append(rel_path)
+    return tempfile.NamedTemporaryFile(
+        "w", dir=full.parent, prefix=f".{full.name}.", suffix=".tmp", delete=False,
+    )
+
+
+def _stream_artifact(repo: Path, paths: tuple[str, ...], produce: Callable[..., None]) -> dict[str, Path | None]:
+    """Run a deferred artifact into temp files and return them by path.
+
+    For multi-file artifacts, a path whose temp file is still empty
+    afterwards maps to None (the response had no section for it).
+    """
+    handles: dict[str, IO[str]] = {}
+    try:
+        for rel_path in paths:
+            handles[rel_path] = _open_file(repo, rel_path)
+        with contextlib.ExitStack() as stack:
+            for fh in handles.values():
+                stack.enter_context(fh)
+            if len(paths) == 1:
+                produce(sink=handles[paths[0]])
+            else:
+                produce(sinks=handles)
+    except BaseException:
+        for fh in handles.values():
+            Path(fh.name).unlink(missing_ok=True)
+        raise
+
+    results: dict[str, Path | None] = {}
+    for rel_path, fh in handles.items():
+        tmp = Path(fh.name)
+        if len(paths) > 1 and tmp.stat().st_size == 0:
+            tmp.unlink()
+            results[rel_path] = None
+        else:
+            results[rel_path] = tmp
+    return results
+
+
+class _SectionWriter:
+    """Write-only sink that routes a streamed multi-document response.
+
+    Lines of the form `===MARKER===` switch output to that marker's sink;
+    anything before the first known marker is dropped.
+    """
+
+    def __init__(self, sinks: dict[str, IO[str]]):
+        self._sinks = sinks
+        self._current: IO[str] | None = None
+        self._partial = ""
+
+    def write(self, text: str) -> int:
+        *lines, self._partial = (self._partial + text).split("\n")
+        for line in lines:
+            self._route(line + "\n")
+        return len(text)
+
+    def close(self) -> None:
+        if self._partial:
+            self._route(self._partial)
+            self._partial = ""
+
+    def _route(self, line: str) -> None:
+        m = _SECTION_RE.match(line.strip())
+        if m and m.group(1) in self._sinks:
+            self._current = self._sinks[m.group(1)]
+        elif self._current is not None:
+            self._current.write(line)
+
+
+def _stream_design_docs(sinks: dict[str, IO[str]], context: str, paths: tuple[str, ...]) -> None:
+    """Generate several design docs in one streamed call, one file each."""
+    sections = "\n\n".join(
+        f"==={DESIGN_DOCS[rel_path][0]}===\n{DESIGN_DOCS[rel_path][1]}" for rel_path in paths
+    )
+    writer = _SectionWriter({DESIGN_DOCS[rel_path][0]: sinks[rel_path] for rel_path in paths})
+    chat_stream(
+        system=(
+            "You are a principal engineer and senior technical writer. Generate the "
+            "following Markdown documents for this repository. Begin each document with "
+            "its marker line exactly as shown, alone on its own line, and write nothing "
+            "outside the documents.\n\n" + sections
+        ),
+        user="Generate the documents for this repository.",
+        sink=writer,
+        cache_segments=[context],
+        max_tokens=DESIGN_DOC_MAX_TOKENS * len(paths),
+    )
+    writer.close()
+
+
+def _write_file(repo: Path, rel_path: str, content: str | Path) -> bool:
+    """Write a file (or move a streamed temp file into place).
+
+    The parent directory must already exist. Returns False (and writes
+    nothing) if the file already exists.
+    """
+    full = repo / rel_path
+    if full.exists():
+        if isinstance(content, Path):
+            content.unlink(missing_ok=True)
+        return False
+    if isinstance(content, Path):
+        os.replace(content, full)
+    else:
+        full.write_text(content)
     log.info("Created: %s", rel_path)
+    return True
 
 
-def _generate_docs(repo: Path, context: str, stack: dict, missing: list, created: list, skipped: list):
+def _generate_docs(context: str, config_context: str, stack: dict, missing: frozenset[str]) -> dict[str | tuple[str, ...], Artifact]:
     """Generate documentation files."""
-    doc_files = [m for m in missing if m in (
-        "README.md", "CONTRIBUTING.md", "SECURITY.md", "CODE_OF_CONDUCT.md",
-        "CHANGELOG.md", "docs/specification.md", "docs/architecture.md", "docs/graph.md",
-    )]
-    if not doc_files:
-        return
+    if not missing & DOC_PATHS:
+        return {}
 
+    artifacts: dict[str | tuple[str, ...], Artifact] = {}
     primary_lang = stack["languages"][0] if stack["languages"] else "python"
 
     # README
     if "README.md" in missing:
-        readme = chat(
+        artifacts["README.md"] = functools.partial(
+            chat_stream,
             system=(
                 "You are a senior technical writer. Generate a comprehensive README.md for this project. "
                 "Include: project title, badges (CI, license), description, features, "
@@ -255,24 +749,25 @@ def _generate_docs(repo: Path, context: str, stack: dict, missing: list, created
                 "project structure, API docs (if applicable), testing, deployment, "
                 "contributing link, license. Use clean markdown with emojis sparingly."
             ),
-            user=f"Generate a best-in-class README.md:\n\n{context}",
+            user="Generate a best-in-class README.md for this repository.",
+            cache_segments=[context],
             max_tokens=4096,
         )
-        _write_file(repo, "README.md", readme, created, skipped)
 
     # CONTRIBUTING
     if "CONTRIBUTING.md" in missing:
-        contrib = chat(
+        artifacts["CONTRIBUTING.md"] = functools.partial(
+            chat_stream,
             system=(
                 "Generate a CONTRIBUTING.md file. Include: how to set up the dev environment, "
                 "branch naming conventions, commit message format (conventional commits), "
                 "PR process, code style guidelines, testing requirements, "
                 f"and issue/bug reporting. Target language: {primary_lang}."
             ),
-            user=f"Generate CONTRIBUTING.md for:\n\n{context}",
+            user="Generate CONTRIBUTING.md for this repository.",
+            cache_segments=[config_context],
             max_tokens=3000,
         )
-        _write_file(repo, "CONTRIBUTING.md", contrib, created, skipped)
 
     # SECURITY
     if "SECURITY.md" in missing:
@@ -305,7 +800,7 @@ We will acknowledge receipt within 48 hours and provide a timeline for a fix.
 - Keep dependencies up to date
 - Run security scanning as part of CI
 """
-        _write_file(repo, "SECURITY.md", security, created, skipped)
+        artifacts["SECURITY.md"] = security
 
     # CODE_OF_CONDUCT
     if "CODE_OF_CONDUCT.md" in missing:
@@ -346,7 +841,7 @@ reported to the project team. All complaints will be reviewed and investigated.
 
 This Code of Conduct is adapted from the [Contributor Covenant](https://www.contributor-covenant.org), version 2.1.
 """
-        _write_file(repo, "CODE_OF_CONDUCT.md", coc, created, skipped)
+        artifacts["CODE_OF_CONDUCT.md"] = coc
 
     # CHANGELOG
     if "CHANGELOG.md" in missing:
@@ -368,44 +863,14 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
 
 ### Removed
 """
-        _write_file(repo, "CHANGELOG.md", changelog, created, skipped)
+        artifacts["CHANGELOG.md"] = changelog
 
     # specification.md, architecture.md, graph.md — use the analyze activity's approach
-    if "docs/specification.md" in missing:
-        spec = chat(
-            system=(
-                "You are a senior technical writer. Generate a comprehensive specification.md. "
-                "Include: project overview, functional requirements (table with IDs), "
-                "data models, API contracts, behaviors, guardrails, acceptance criteria."
-            ),
-            user=f"Generate specification.md:\n\n{context}",
-            max_tokens=6000,
-        )
-        _write_file(repo, "docs/specification.md", spec, created, skipped)
-
-    if "docs/architecture.md" in missing:
-        arch = chat(
-            system=(
-                "You are a principal engineer. Generate architecture.md. "
-                "Include: system overview, layer diagram, component descriptions, "
-                "data layer, external deps, security, scalability, error handling."
-            ),
-            user=f"Generate architecture.md:\n\n{context}",
-            max_tokens=6000,
-        )
-        _write_file(repo, "docs/architecture.md", arch, created, skipped)
-
-    if "docs/graph.md" in missing:
-        graph = chat(
-            system=(
-                "You are a software architect. Generate graph.md with Mermaid diagrams. "
-                "Include: component dependency graph, data flow, sequence diagrams. "
-                "Use ```mermaid code blocks."
-            ),
-            user=f"Generate graph.md:\n\n{context}",
-            max_tokens=6000,
-        )
-        _write_file(repo, "docs/graph.md", graph, created, skipped)
+    # Specification, architecture and graph share all their input, so
+    # whichever are missing are generated together in one streamed call.
+    design_docs = tuple(rel_path for rel_path in DESIGN_DOCS if rel_path in missing)
+    if design_docs:
+        artifacts[design_docs] = functools.partial(_stream_design_docs, context=context, paths=design_docs)
 
     # ADR template
     if "docs/adr/001-template.md" in missing:
@@ -432,92 +897,120 @@ What becomes easier or more difficult to do because of this change?
 ### Neutral
 -
 """
-        _write_file(repo, "docs/adr/001-template.md", adr, created, skipped)
+        artifacts["docs/adr/001-template.md"] = adr
+
+    return artifacts
 
 
-def _generate_ci(repo: Path, context: str, stack: dict, missing: list, created: list, skipped: list):
+def _generate_ci(context: str, stack: dict, missing: frozenset[str]) -> dict[str | tuple[str, ...], Artifact]:
     """Generate CI/CD configuration."""
     if ".github/workflows/ci.yml" not in missing:
-        return
+        return {}
 
     primary_lang = stack["languages"][0] if stack["languages"] else "python"
 
-    ci = chat(
-        system=(
-            f"Generate a GitHub Actions CI workflow (.github/workflows/ci.yml) for a {primary_lang} project. "
-            "Include:\n"
-            "- Trigger on push to main and pull_request\n"
-            "- Matrix testing if appropriate\n"
-            "- Steps: checkout, setup language, install deps, lint, type-check, test, coverage\n"
-            f"- Package manager: {stack['package_manager'] or 'auto-detect'}\n"
-            f"- Test framework: {stack['test_framework'] or 'auto-detect'}\n"
-            "Output ONLY the YAML file content, no markdown fences."
-        ),
-        user=f"Generate ci.yml for:\n\n{context}",
-        max_tokens=2000,
-    )
-    # Strip markdown fences if LLM wraps it
-    ci = ci.strip()
-    if ci.startswith("```"):
-        ci = "\n".join(ci.split("\n")[1:])
-    if ci.endswith("```"):
-        ci = "\n".join(ci.split("\n")[:-1])
-
-    _write_file(repo, ".github/workflows/ci.yml", ci.strip() + "\n", created, skipped)
-
-
-def _generate_tooling(repo: Path, context: str, stack: dict, missing: list, created: list, skipped: list):
-    """Generate Makefile and .env.example."""
-    primary_lang = stack["languages"][0] if stack["languages"] else "python"
+    if _uses_templates(stack):
+        if primary_lang == "python":
+            install = _PYTHON_INSTALL.get(stack["package_manager"], "pip install -e .")
+            return {".github/workflows/ci.yml": _render_template(CI_PYTHON, install=install)}
+        return {".github/workflows/ci.yml": CI_NODE}
 
-    if "Makefile" in missing:
-        makefile = chat(
+    def ci_yml(sink: IO[str]) -> None:
+        ci = chat(
             system=(
-                f"Generate a Makefile for a {primary_lang} project. Include targets:\n"
-                "- help (default, lists targets)\n"
-                "- install (install dependencies)\n"
-                "- dev (start dev server)\n"
-                "- test (run tests)\n"
-                "- lint (run linter)\n"
-                "- format (run formatter)\n"
-                "- typecheck (run type checker)\n"
-                "- clean (remove build artifacts)\n"
-                "- docker-up / docker-down (if applicable)\n"
-                f"Package manager: {stack['package_manager'] or 'auto-detect'}. "
-                f"Test framework: {stack['test_framework'] or 'auto-detect'}. "
-                "Output ONLY the Makefile content, no markdown fences. Use tabs for indentation."
+                f"Generate a GitHub Actions CI workflow (.github/workflows/ci.yml) for a {primary_lang} project. "
+                "Include:\n"
+                "- Trigger on push to main and pull_request\n"
+                "- Matrix testing if appropriate\n"
+                "- Steps: checkout, setup language, install deps, lint, type-check, test, coverage\n"
+                f"- Package manager: {stack['package_manager'] or 'auto-detect'}\n"
+                f"- Test framework: {stack['test_framework'] or 'auto-detect'}\n"
+                "Output ONLY the YAML file content, no markdown fences."
             ),
-            user=f"Generate Makefile for:\n\n{context}",
+            user="Generate ci.yml for this repository.",
+            cache_segments=[context],
             max_tokens=2000,
         )
-        makefile = makefile.strip()
-        if makefile.startswith("```"):
-            makefile = "\n".join(makefile.split("\n")[1:])
-        if makefile.endswith("```"):
-            makefile = "\n".join(makefile.split("\n")[:-1])
-        _write_file(repo, "Makefile", makefile.strip() + "\n", created, skipped)
-
-    if ".env.example" in missing:
-        env_example = chat(
-            system=(
-                "Generate a .env.example file for this project. "
-                "List all environment variables the project needs based on the code, "
-                "with placeholder values and comments explaining each. "
-                "Output ONLY the file content, no markdown fences."
-            ),
-            user=f"Generate .env.example:\n\n{context}",
-            max_tokens=1000,
-        )
-        env_example = env_example.strip()
-        if env_example.startswith("```"):
-            env_example = "\n".join(env_example.split("\n")[1:])
-        if env_example.endswith("```"):
-            env_example = "\n".join(env_example.split("\n")[:-1])
-        _write_file(repo, ".env.example", env_example.strip() + "\n", created, skipped)
+        sink.write(_strip_fence(ci))
+
+    return {".github/workflows/ci.yml": ci_yml}
 
 
-def _generate_templates(repo: Path, context: str, stack: dict, missing: list, created: list, skipped: list):
+def _generate_tooling(
+    context: str, config_context: str, stack: dict, missing: frozenset[str], files: dict,
+) -> dict[str | tuple[str, ...], Artifact]:
+    """Generate Makefile and .env.example."""
+    if not missing & {"Makefile", ".env.example"}:
+        return {}
+
+    artifacts: dict[str | tuple[str, ...], Artifact] = {}
+    primary_lang = stack["languages"][0] if stack["languages"] else "python"
+
+    if "Makefile" in missing and _uses_templates(stack):
+        if primary_lang == "python":
+            install = _PYTHON_INSTALL.get(stack["package_manager"], "pip install -e .")
+            artifacts["Makefile"] = _render_template(MAKEFILE_PYTHON, install=install, **_makefile_docker(stack))
+        else:
+            artifacts["Makefile"] = _render_template(MAKEFILE_NODE, **_makefile_docker(stack))
+    elif "Makefile" in missing:
+        def makefile_content(sink: IO[str]) -> None:
+            makefile = chat(
+                system=(
+                    f"Generate a Makefile for a {primary_lang} project. Include targets:\n"
+                    "- help (default, lists targets)\n"
+                    "- install (install dependencies)\n"
+                    "- dev (start dev server)\n"
+                    "- test (run tests)\n"
+                    "- lint (run linter)\n"
+                    "- format (run formatter)\n"
+                    "- typecheck (run type checker)\n"
+                    "- clean (remove build artifacts)\n"
+                    "- docker-up / docker-down (if applicable)\n"
+                    f"Package manager: {stack['package_manager'] or 'auto-detect'}. "
+                    f"Test framework: {stack['test_framework'] or 'auto-detect'}. "
+                    "Output ONLY the Makefile content, no markdown fences. Use tabs for indentation."
+                ),
+                user="Generate Makefile for this repository.",
+                cache_segments=[config_context],
+                max_tokens=2000,
+            )
+            sink.write(_strip_fence(makefile))
+
+        artifacts["Makefile"] = makefile_content
+
+    env_from_code = _env_example_from_code(files) if ".env.example" in missing else None
+    if env_from_code is not None:
+        artifacts[".env.example"] = env_from_code
+    elif ".env.example" in missing:
+        def env_example_content(sink: IO[str]) -> None:
+            env_example = chat(
+                system=(
+                    "Generate a .env.example file for this project. "
+                    "List all environment variables the project needs based on the code, "
+                    "with placeholder values and comments explaining each. "
+                    "Output ONLY the file content, no markdown fences."
+                ),
+                user="Generate .env.example for this repository.",
+                cache_segments=[context],
+                max_tokens=1000,
+            )
+            sink.write(_strip_fence(env_example))
+
+        artifacts[".env.example"] = env_example_content
+
+    return artifacts
+
+
+def _generate_templates(context: str, stack: dict, missing: frozenset[str]) -> dict[str | tuple[str, ...], Artifact]:
     """Generate PR and issue templates."""
+    if not missing & {
+        ".github/PULL_REQUEST_TEMPLATE.md",
+        ".github/ISSUE_TEMPLATE/bug_report.md",
+        ".github/ISSUE_TEMPLATE/feature_request.md",
+    }:
+        return {}
+
+    artifacts: dict[str | tuple[str, ...], Artifact] = {}
     if ".github/PULL_REQUEST_TEMPLATE.md" in missing:
         pr_template = """## Description
 <!-- What does this PR do? -->
@@ -541,7 +1034,7 @@ def _generate_templates(repo: Path, context: str, stack: dict, missing: list, cr
 - [ ] I have added tests that prove my fix is effective or my feature works
 - [ ] New and existing unit tests pass locally with my changes
 """
-        _write_file(repo, ".github/PULL_REQUEST_TEMPLATE.md", pr_template, created, skipped)
+        artifacts[".github/PULL_REQUEST_TEMPLATE.md"] = pr_template
 
     if ".github/ISSUE_TEMPLATE/bug_report.md" in missing:
         bug = """---
@@ -577,7 +1070,7 @@ If applicable, add screenshots or log output.
 ## Additional Context
 Any other context about the problem.
 """
-        _write_file(repo, ".github/ISSUE_TEMPLATE/bug_report.md", bug, created, skipped)
+        artifacts[".github/ISSUE_TEMPLATE/bug_report.md"] = bug
 
     if ".github/ISSUE_TEMPLATE/feature_request.md" in missing:
         feature = """---
@@ -599,59 +1092,66 @@ A description of any alternative solutions or features you've considered.
 ## Additional Context
 Add any other context or screenshots about the feature request.
 """
-        _write_file(repo, ".github/ISSUE_TEMPLATE/feature_request.md", feature, created, skipped)
+        artifacts[".github/ISSUE_TEMPLATE/feature_request.md"] = feature
 
+    return artifacts
 
-def _generate_tests_scaffold(repo: Path, context: str, stack: dict, missing: list, created: list, skipped: list):
+
+def _generate_tests_scaffold(context: str, stack: dict, missing: frozenset[str]) -> dict[str | tuple[str, ...], Artifact]:
     """Generate test directory structure if missing."""
     if "tests/" not in missing:
-        return
+        return {}
 
+    artifacts: dict[str | tuple[str, ...], Artifact] = {}
     primary_lang = stack["languages"][0] if stack["languages"] else "python"
-    tests_dir = repo / "tests"
 
     if primary_lang == "python":
-        _write_file(repo, "tests/__init__.py", "", created, skipped)
-
-        conftest = chat(
-            system=(
-                "Generate a pytest conftest.py with useful shared fixtures for this project. "
-                "Include fixtures for: temporary directories, mock environment variables, "
-                "sample data, and any project-specific fixtures based on the code. "
-                "Output ONLY Python code, no markdown fences."
-            ),
-            user=f"Generate tests/conftest.py:\n\n{context}",
-            max_tokens=2000,
-        )
-        conftest = conftest.strip()
-        if conftest.startswith("```"):
-            conftest = "\n".join(conftest.split("\n")[1:])
-        if conftest.endswith("```"):
-            conftest = "\n".join(conftest.split("\n")[:-1])
-        _write_file(repo, "tests/conftest.py", conftest.strip() + "\n", created, skipped)
+        artifacts["tests/__init__.py"] = ""
+
+        if _uses_templates(stack):
+            artifacts["tests/conftest.py"] = CONFTEST_PYTHON
+            for subdir in ["unit", "integration"]:
+                artifacts[f"tests/{subdir}/__init__.py"] = ""
+            artifacts["tests/unit/test_core.py"] = TEST_CORE_PYTHON
+            return artifacts
+
+        def conftest_content(sink: IO[str]) -> None:
+            conftest = chat(
+                system=(
+                    "Generate a pytest conftest.py with useful shared fixtures for this project. "
+                    "Include fixtures for: temporary directories, mock environment variables, "
+                    "sample data, and any project-specific fixtures based on the code. "
+                    "Output ONLY Python code, no markdown fences."
+                ),
+                user="Generate tests/conftest.py for this repository.",
+                cache_segments=[context],
+                max_tokens=2000,
+            )
+            sink.write(_strip_fence(conftest))
+
+        artifacts["tests/conftest.py"] = conftest_content
 
         # Create subdirectories
         for subdir in ["unit", "integration"]:
-            _write_file(repo, f"tests/{subdir}/__init__.py", "", created, skipped)
+            artifacts[f"tests/{subdir}/__init__.py"] = ""
 
         # Generate a sample unit test
-        sample_test = chat(
-            system=(
-                "Generate a sample pytest unit test file for this project. "
-                "Test the most important/core functionality. Use mocks where needed. "
-                "Include at least 3 test functions. Output ONLY Python code, no markdown fences."
-            ),
-            user=f"Generate tests/unit/test_core.py:\n\n{context}",
-            max_tokens=2000,
-        )
-        sample_test = sample_test.strip()
-        if sample_test.startswith("```"):
-            sample_test = "\n".join(sample_test.split("\n")[1:])
-        if sample_test.endswith("```"):
-            sample_test = "\n".join(sample_test.split("\n")[:-1])
-        _write_file(repo, "tests/unit/test_core.py", sample_test.strip() + "\n", created, skipped)
+        def sample_test_content(sink: IO[str]) -> None:
+            sample_test = chat(
+                system=(
+                    "Generate a sample pytest unit test file for this project. "
+                    "Test the most important/core functionality. Use mocks where needed. "
+                    "Include at least 3 test functions. Output ONLY Python code, no markdown fences."
+                ),
+                user="Generate tests/unit/test_core.py for this repository.",
+                cache_segments=[context],
+                max_tokens=2000,
+            )
+            sink.write(_strip_fence(sample_test))
+
+        artifacts["tests/unit/test_core.py"] = sample_test_content
 
     elif primary_lang in ("javascript", "typescript"):
-        _write_file(repo, "tests/.gitkeep", "", created, skipped)
+        artifacts["tests/.gitkeep"] = ""
 
-    log.info("Test scaffold created")
+    return artifacts
@@ -46,11 +46,64 @@ CATEGORY_PROMPTS = {
     ),
 }
 
+# All four categories are requested in one call so the file summary is only
+# sent once.
+SUGGEST_SYSTEM = (
+    "You are a senior software engineer performing a code review. "
+    "Respond with a JSON object that has one key per category "
+    f"({', '.join(CATEGORIES)}), each holding a list of improvements:\n"
+    '{"features": [\n'
+    '  {"title": "...", "description": "...", "priority": "high|medium|low",\n'
+    '   "files_affected": ["path/to/file.py"],\n'
+    '   "changes": [{"file": "path/to/file.py", "description": "what to change", '
+    '"code_hint": "brief code snippet or approach", "apply_hint_directly": false}]}\n'
+    '], "security": [...], "compliance": [...], "integration": [...]}\n\n'
+    "Suggest 2-4 concrete, actionable improvements per category. Each change must "
+    "reference specific files and describe exactly what to modify. Set "
+    "apply_hint_directly to true only when code_hint is the complete, final content "
+    "of the file; it is then written as-is.\n\n"
+    + "\n\n".join(f"{category.upper()}: {CATEGORY_PROMPTS[category]}" for category in CATEGORIES)
+)
 
-def suggest_improvements(repo_path: str) -> list[dict]:
+_CHANGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "file": {"type": "string"},
+        "description": {"type": "string"},
+        "code_hint": {"type": "string"},
+        "apply_hint_directly": {"type": "boolean"},
+    },
+    "required": ["file", "description", "code_hint", "apply_hint_directly"],
+    "additionalProperties": False,
+}
+
+_IMPROVEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "priority": {"type": "string", "enum": ["high", "medium", "low"]},
+        "files_affected": {"type": "array", "items": {"type": "string"}},
+        "changes": {"type": "array", "items": _CHANGE_SCHEMA},
+    },
+    "required": ["title", "description", "priority", "files_affected", "changes"],
+    "additionalProperties": False,
+}
+
+SUGGEST_SCHEMA = {
+    "type": "object",
+    "properties": {category: {"type": "array", "items": _IMPROVEMENT_SCHEMA} for category in CATEGORIES},
+    "required": CATEGORIES,
+    "additionalProperties": False,
+}
+
+
+def suggest_improvements(repo_path: str, scan: dict | None = None) -> list[dict]:
     """
     Analyze the repo and suggest improvements in all four categories.
 
+    Pass `scan` (a scan_repo() result) to reuse a scan the caller already has.
+
     Returns:
         List of improvement dicts, each with:
         {
@@ -60,37 +113,28 @@ def suggest_improvements(repo_path: str) -> list[dict]:
             "description": "...",
             "priority": "high|medium|low",
             "files_affected": ["path/to/file.py"],
-            "changes": [{"file": "...", "description": "...", "code_hint": "..."}]
+            "changes": [{"file": "...", "description": "...", "code_hint": "...",
+                         "apply_hint_directly": bool}]
         }
     """
     log.info("Scanning repo for improvement suggestions: %s", repo_path)
-    scan = scan_repo(repo_path)
+    if scan is None:
+        scan = scan_repo(repo_path)
     file_summary = build_file_summary(scan["files"])
 
+    log.info("Generating %s improvements", ", ".join(CATEGORIES))
+    result = chat_json(
+        system=SUGGEST_SYSTEM,
+        user=f"Analyze this codebase and suggest improvements in every category:\n\n{file_summary}",
+        max_tokens=12288,
+        schema=SUGGEST_SCHEMA,
+        schema_name="improvements",
+    )
+
     all_improvements = []
     imp_counter = 1
-
     for category in CATEGORIES:
-        log.info("Generating %s improvements", category)
-        result = chat_json(
-            system=(
-                "You are a senior software engineer performing a code review. "
-                "You MUST respond with valid JSON in this exact format:\n"
-                '{"improvements": [\n'
-                '  {"title": "...", "description": "...", "priority": "high|medium|low",\n'
-                '   "files_affected": ["path/to/file.py"],\n'
-                '   "changes": [{"file": "path/to/file.py", "description": "what to change", '
-                '"code_hint": "brief code snippet or approach"}]}\n'
-                "]}\n\n"
-                "Suggest 2-4 concrete, actionable improvements. Each change must reference "
-                "specific files and describe exactly what to modify.\n\n"
-                f"FOCUS: {CATEGORY_PROMPTS[category]}"
-            ),
-            user=f"Analyze this codebase and suggest {category} improvements:\n\n{file_summary}",
-            max_tokens=4096,
-        )
-
-        for imp in result.get("improvements", []):
+        for imp in result.get(category, []):
             imp["id"] = f"IMP-{imp_counter:03d}"
             imp["category"] = category
             imp_counter += 1
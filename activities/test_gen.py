@@ -6,9 +6,11 @@ Activity: Test Generation — creates test cases in four groups
 from __future__ import annotations
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from utils.llm import chat_json
+import config
+from utils.llm import chat_json, submit_warmed
 from utils.repo_scanner import scan_repo, build_file_summary
 
 log = logging.getLogger(__name__)
@@ -42,17 +44,46 @@ GROUP_PROMPTS = {
     ),
 }
 
+# Shared by all groups; the group focus goes in the user message so the
+# common prefix (repo context + this prompt) is identical across calls.
+TEST_GEN_SYSTEM = (
+    "You are a senior QA engineer. Generate a complete pytest test file.\n\n"
+    "Respond with JSON:\n"
+    '{"test_file_content": "...complete Python test file...", '
+    '"test_count": int, '
+    '"test_names": ["test_name_1", "test_name_2"]}\n\n'
+    "REQUIREMENTS:\n"
+    "- Use pytest conventions (functions starting with test_)\n"
+    "- Import from the target repo's modules correctly\n"
+    "- Use fixtures where appropriate\n"
+    "- Include docstrings for each test\n"
+    "- Tests should be runnable standalone\n"
+    "- Mock external API calls (OpenAI) — never call real APIs in tests\n"
+    "- tests/conftest.py provides fixtures: `app` (the FastAPI app), `async_client` "
+    "(httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test')), "
+    "`client` (a TestClient, only for sync tests) and `mock_openai` (patched chat "
+    "completions create; set its return_value to shape responses). Request these by name "
+    "instead of constructing clients or patching OpenAI in each test\n"
+    "- Write API tests as `@pytest.mark.asyncio` async tests using `async_client`"
+)
 
-def generate_tests(repo_path: str, improvements: list[dict], applied_changes: list[dict]) -> list[dict]:
+
+def generate_tests(
+    repo_path: str, improvements: list[dict], applied_changes: list[dict], scan: dict | None = None,
+) -> list[dict]:
     """
     Generate test cases for all four groups.
 
+    Pass `scan` to reuse a scan the caller already has; it must reflect the
+    applied changes (see repo_scanner.rescan_files).
+
     Returns:
         List of test file dicts:
         [{"group": "...", "file": "tests/test_X.py", "test_count": int, "content": "..."}]
     """
     log.info("Generating tests for %s", repo_path)
-    scan = scan_repo(repo_path)
+    if scan is None:
+        scan = scan_repo(repo_path)
     file_summary = build_file_summary(scan["files"], max_chars=30_000)
 
     # Build changes context
@@ -61,48 +92,41 @@ def generate_tests(repo_path: str, improvements: list[dict], applied_changes: li
         for c in applied_changes if c["status"] == "applied"
     )
 
-    test_files = []
-
-    for group in TEST_GROUPS:
-        log.info("Generating %s tests", group)
-        result = chat_json(
-            system=(
-                "You are a senior QA engineer. Generate a complete pytest test file.\n\n"
-                "Respond with JSON:\n"
-                '{"test_file_content": "...complete Python test file...", '
-                '"test_count": int, '
-                '"test_names": ["test_name_1", "test_name_2"]}\n\n'
-                "REQUIREMENTS:\n"
-                "- Use pytest conventions (functions starting with test_)\n"
-                "- Import from the target repo's modules correctly\n"
-                "- Use fixtures where appropriate\n"
-                "- Include docstrings for each test\n"
-                "- Tests should be runnable standalone\n"
-                "- Mock external API calls (OpenAI) — never call real APIs in tests\n"
-                "- Use httpx.AsyncClient with FastAPI's TestClient pattern for API tests\n\n"
-                f"FOCUS: {GROUP_PROMPTS[group]}"
-            ),
-            user=(
-                f"Generate {group} tests for this codebase:\n\n"
-                f"## Applied Changes\n{changes_ctx}\n\n"
-                f"## Codebase (key files)\n{file_summary}"
-            ),
-            max_tokens=8192,
-        )
-
-        content = result.get("test_file_content", "")
-        test_count = result.get("test_count", 0)
-        test_names = result.get("test_names", [])
-        file_name = f"tests/test_{group}.py"
-
-        test_files.append({
-            "group": group,
-            "file": file_name,
-            "test_count": test_count,
-            "test_names": test_names,
-            "content": content,
-        })
+    # Static context first so every group's request shares a cacheable prefix
+    shared_context = (
+        f"## Codebase (key files)\n{file_summary}\n\n"
+        f"## Applied Changes\n{changes_ctx}\n"
+    )
+
+    # The groups are independent, so their LLM calls run concurrently
+    with ThreadPoolExecutor(max_workers=min(config.LLM_CONCURRENCY, len(TEST_GROUPS))) as ex:
+        futs = submit_warmed(ex, _generate_group, [(group, shared_context) for group in TEST_GROUPS])
+        test_files = [fut.result() for fut in futs]
 
     log.info("Generated %d test files with %d total tests",
              len(test_files), sum(t["test_count"] for t in test_files))
     return test_files
+
+
+def _generate_group(group: str, shared_context: str) -> dict:
+    """Generate the test file for one group."""
+    log.info("Generating %s tests", group)
+    result = chat_json(
+        system=TEST_GEN_SYSTEM,
+        user=f"Generate {group} tests for this codebase.\n\nFOCUS: {GROUP_PROMPTS[group]}",
+        max_tokens=8192,
+        cache_segments=[shared_context],
+    )
+
+    content = result.get("test_file_content", "")
+    test_count = result.get("test_count", 0)
+    test_names = result.get("test_names", [])
+    file_name = f"tests/test_{group}.py"
+
+    return {
+        "group": group,
+        "file": file_name,
+        "test_count": test_count,
+        "test_names": test_names,
+        "content": content,
+    }
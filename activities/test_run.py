@@ -4,124 +4,335 @@ Activity: Test Runner — writes test files to the target repo and executes them
 
 from __future__ import annotations
 
+import json
 import logging
+import os
+import re
 import subprocess
+import tempfile
 from pathlib import Path
 
 log = logging.getLogger(__name__)
 
+# Seconds of pytest run time allowed per test group
+PYTEST_TIMEOUT_PER_GROUP = 120
 
-def run_tests(repo_path: str, test_files: list[dict]) -> list[dict]:
+# Characters of pytest output kept per group result
+OUTPUT_LIMIT = 5000
+
+# Written to tests/conftest.py. The app fixtures are session-scoped so the app
+# is imported once for all groups in the single pytest session; mock_openai is
+# per test so one test's return_value or call history never leaks into the
+# next. Generated tests are told to use them by name.
+CONFTEST_HEADER = '''"""Shared pytest fixtures."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Ensure the repo root is importable
+sys.path.insert(0, str(Path(__file__).parent.parent))
+'''
+
+SHARED_FIXTURES = {
+    "app": '''
+
+@pytest.fixture(scope="session")
+def app():
+    """The project's FastAPI app, imported once per session."""
+    import importlib
+
+    for module_name in ("app", "main", "src.app", "src.main", "api.main", "app.main"):
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        if hasattr(module, "app"):
+            return module.app
+    pytest.skip("no FastAPI app found")
+''',
+    "client": '''
+
+@pytest.fixture(scope="session")
+def client(app):
+    """FastAPI TestClient shared by all tests in the session."""
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as test_client:
+        yield test_client
+''',
+    "async_client": '''
+
+try:
+    import pytest_asyncio
+except ImportError:  # async API tests need pytest-asyncio
+    pytest_asyncio = None
+
+if pytest_asyncio is not None:
+    @pytest_asyncio.fixture
+    async def async_client(app):
+        """httpx.AsyncClient dispatching straight to the app over ASGI (no server, no threads)."""
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            yield ac
+''',
+    "mock_openai": '''
+
+@pytest.fixture
+def mock_openai(monkeypatch):
+    """Patch OpenAI chat completions for one test; never call the real API."""
+    from unittest.mock import MagicMock
+
+    completions = pytest.importorskip("openai.resources.chat.completions")
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content="{}"))]
+    create = MagicMock(return_value=response)
+    monkeypatch.setattr(completions.Completions, "create", create)
+    return create
+''',
+}
+
+# pytest plugin loaded into the test run (from a temp dir, so nothing from
+# repo-pilot lands on the target repo's import path). It bins outcomes by test
+# file and writes them as JSON to $REPO_PILOT_REPORT when the session ends.
+# Failure text per file stops growing once it passes the output limit.
+REPORT_PLUGIN = "repo_pilot_report"
+REPORT_PLUGIN_SOURCE = '''
+import json
+import os
+
+OUTPUT_LIMIT = int(os.environ.get("REPO_PILOT_OUTPUT_LIMIT", "5000"))
+_files = {}
+
+
+def _entry(nodeid):
+    path = nodeid.split("::", 1)[0]
+    return _files.setdefault(path, {"passed": 0, "failed": 0, "errors": [], "output": ""})
+
+
+def _add_output(entry, text):
+    if len(entry["output"]) < OUTPUT_LIMIT:
+        entry["output"] += text
+
+
+def pytest_collectreport(report):
+    if report.failed:
+        entry = _entry(report.nodeid)
+        entry["errors"].append(f"ERROR collecting {report.nodeid}")
+        _add_output(entry, report.longreprtext + "\\n")
+
+
+def pytest_runtest_logreport(report):
+    entry = _entry(report.nodeid)
+    if report.when == "call" and report.passed:
+        entry["passed"] += 1
+    elif report.failed:
+        if report.when == "call":
+            entry["failed"] += 1
+            entry["errors"].append(f"FAILED {report.nodeid}")
+        else:
+            entry["errors"].append(f"ERROR {report.nodeid} ({report.when})")
+        _add_output(entry, f"_____ {report.nodeid} _____\\n{report.longreprtext}\\n")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if hasattr(session.config, "workerinput"):
+        return  # xdist worker; the controller receives every report
+    with open(os.environ["REPO_PILOT_REPORT"], "w") as f:
+        json.dump(_files, f)
+'''
+
+
+def run_tests(repo_path: str, test_files: list[dict], execute: bool = True) -> list[dict]:
     """
     Write generated test files into the target repo and run them with pytest.
 
+    With execute=False the files are only written (so they can be committed)
+    and no tests are run.
+
     Returns:
         List of test results per group:
         [{"group": "...", "total": int, "passed": int, "failed": int, "errors": [...], "output": "..."}]
     """
     repo = Path(repo_path)
     tests_dir = repo / "tests"
-    tests_dir.mkdir(exist_ok=True)
+    tests_dir.mkdir(parents=True, exist_ok=True)
 
-    # Write conftest if missing
-    conftest = tests_dir / "conftest.py"
-    if not conftest.exists():
-        conftest.write_text(
-            '"""Shared pytest fixtures."""\n\n'
-            "import sys\n"
-            "from pathlib import Path\n\n"
-            "# Ensure the repo root is importable\n"
-            "sys.path.insert(0, str(Path(__file__).parent.parent))\n"
-        )
+    _write_conftest(tests_dir / "conftest.py")
 
     # Write __init__.py if missing
     init = tests_dir / "__init__.py"
     if not init.exists():
         init.write_text("")
 
-    # Write test files
-    for tf in test_files:
-        file_path = repo / tf["file"]
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(tf["content"])
+    # Write test files: one mkdir per distinct directory (normally just
+    # tests/, created above), then a single unbuffered write per file
+    paths = [repo / tf["file"] for tf in test_files]
+    for parent in {p.parent for p in paths} - {tests_dir}:
+        parent.mkdir(parents=True, exist_ok=True)
+    for tf, file_path in zip(test_files, paths):
+        _write_bytes(file_path, tf["content"].encode())
         log.info("Wrote test file: %s (%d tests)", tf["file"], tf["test_count"])
 
-    # Run pytest per group
+    if not test_files or not execute:
+        return []
+
+    # Run every group in one pytest session: one start-up and one conftest
+    # collection instead of one per group, with the groups spread over xdist
+    # workers when available. The report plugin records outcomes per test
+    # file, which maps 1:1 to groups.
+    timeout = PYTEST_TIMEOUT_PER_GROUP * max(len(test_files), 1)
+    log.info("Running %d test groups in one pytest session", len(test_files))
+    try:
+        report, output, exit_code = _run_pytest(repo, [tf["file"] for tf in test_files], timeout)
+    except subprocess.TimeoutExpired:
+        log.error("Tests: TIMEOUT after %ds", timeout)
+        return [_error_result(tf, f"Test execution timed out after {timeout}s", "TIMEOUT") for tf in test_files]
+    except Exception as e:
+        log.error("Tests: ERROR: %s", e)
+        return [_error_result(tf, str(e), str(e)) for tf in test_files]
+
     results = []
     for tf in test_files:
         group = tf["group"]
-        test_path = repo / tf["file"]
-        log.info("Running %s tests: %s", group, test_path)
+        file_report = report.get(tf["file"])
+        if file_report is None:
+            # Nothing was collected for this file; surface pytest's own output
+            results.append(_error_result(tf, f"No test results for {tf['file']}", output, exit_code))
+            log.error("%s tests: no results (exit=%d)", group, exit_code)
+            continue
+        passed, failed = file_report["passed"], file_report["failed"]
+        results.append({
+            "group": group,
+            "file": tf["file"],
+            "total": passed + failed,
+            "passed": passed,
+            "failed": failed,
+            "errors": file_report["errors"],
+            "output": (file_report["output"] or f"{passed} passed")[:OUTPUT_LIMIT],
+            "exit_code": exit_code,
+        })
+        log.info("%s tests: %d passed, %d failed (exit=%d)", group, passed, failed, exit_code)
 
-        try:
+    total_passed = sum(r["passed"] for r in results)
+    total_failed = sum(r["failed"] for r in results)
+    log.info("All tests complete: %d passed, %d failed", total_passed, total_failed)
+    return results
+
+
+def _write_bytes(path: Path, data: bytes) -> None:
+    """Create/truncate `path` and write `data` with one syscall-level write."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _write_conftest(conftest: Path) -> None:
+    """Write the shared conftest, or add the shared fixtures it is missing."""
+    if not conftest.exists():
+        conftest.write_text(CONFTEST_HEADER + "".join(SHARED_FIXTURES.values()))
+        return
+    text = conftest.read_text()
+    missing = [name for name in SHARED_FIXTURES if not re.search(rf"^\s*(?:async\s+)?def {name}\(", text, re.M)]
+    if missing:
+        block = "\n\n\n# Shared fixtures used by generated tests"
+        if not re.search(r"^import pytest\b", text, re.M):
+            block += "\nimport pytest\n"
+        conftest.write_text(text.rstrip("\n") + block + "".join(SHARED_FIXTURES[name] for name in missing))
+
+
+def _run_pytest(repo: Path, test_paths: list[str], timeout: int) -> tuple[dict, str, int]:
+    """Run pytest once over all test paths with the report plugin loaded.
+
+    Returns (per-file report, tail of the combined output, exit code).
+    Output goes to a file rather than a pipe, so a run with huge tracebacks
+    never sits in memory; only its last OUTPUT_LIMIT characters are read.
+    """
+    with tempfile.TemporaryDirectory(prefix="repo-pilot-pytest-") as tmp:
+        plugin_dir = Path(tmp)
+        (plugin_dir / f"{REPORT_PLUGIN}.py").write_text(REPORT_PLUGIN_SOURCE)
+        report_path = plugin_dir / "report.json"
+        output_path = plugin_dir / "output.log"
+
+        env = _build_env(repo)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(plugin_dir), env.get("PYTHONPATH")]))
+        env["REPO_PILOT_REPORT"] = str(report_path)
+        env["REPO_PILOT_OUTPUT_LIMIT"] = str(OUTPUT_LIMIT)
+
+        # With pytest-xdist, groups run in parallel: one file per worker
+        parallel = []
+        workers = min(len(test_paths), os.cpu_count() or 1)
+        if workers > 1 and _has_xdist(repo, env):
+            parallel = ["-n", str(workers), "--dist=loadfile"]
+
+        with open(output_path, "wb") as out:
             proc = subprocess.run(
                 [
                     "python", "-m", "pytest",
-                    str(test_path),
+                    *test_paths,
+                    "-p", REPORT_PLUGIN,
+                    # One group's import error must not abort the other groups
+                    "--continue-on-collection-errors",
+                    *parallel,
                     "-v",
                     "--tb=short",
                     "--no-header",
                     "-q",
                 ],
-                capture_output=True,
-                text=True,
-                timeout=120,
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                timeout=timeout,
                 cwd=str(repo),
-                env=_build_env(repo),
-            )
-            output = proc.stdout + proc.stderr
-            passed, failed, errors = _parse_pytest_output(output)
-
-            results.append({
-                "group": group,
-                "file": tf["file"],
-                "total": passed + failed,
-                "passed": passed,
-                "failed": failed,
-                "errors": errors,
-                "output": output[:5000],
-                "exit_code": proc.returncode,
-            })
-            log.info(
-                "%s tests: %d passed, %d failed (exit=%d)",
-                group, passed, failed, proc.returncode,
+                env=env,
             )
+        try:
+            report = json.loads(report_path.read_text())
+        except (OSError, ValueError):
+            report = {}
+        output = _tail(output_path, OUTPUT_LIMIT)
+    return report, output, proc.returncode
 
-        except subprocess.TimeoutExpired:
-            results.append({
-                "group": group,
-                "file": tf["file"],
-                "total": 0,
-                "passed": 0,
-                "failed": 0,
-                "errors": ["Test execution timed out after 120s"],
-                "output": "TIMEOUT",
-                "exit_code": -1,
-            })
-            log.error("%s tests: TIMEOUT", group)
-
-        except Exception as e:
-            results.append({
-                "group": group,
-                "file": tf["file"],
-                "total": 0,
-                "passed": 0,
-                "failed": 0,
-                "errors": [str(e)],
-                "output": str(e),
-                "exit_code": -1,
-            })
-            log.error("%s tests: ERROR: %s", group, e)
 
-    total_passed = sum(r["passed"] for r in results)
-    total_failed = sum(r["failed"] for r in results)
-    log.info("All tests complete: %d passed, %d failed", total_passed, total_failed)
-    return results
+def _tail(path: Path, limit: int) -> str:
+    """Last `limit` characters (approximately; read as bytes) of a text file."""
+    with open(path, "rb") as f:
+        f.seek(max(f.seek(0, os.SEEK_END) - limit, 0))
+        return f.read().decode(errors="replace")
+
+
+def _has_xdist(repo: Path, env: dict) -> bool:
+    """Whether pytest-xdist is importable in the environment tests run in."""
+    try:
+        return subprocess.run(
+            ["python", "-c", "import xdist"],
+            capture_output=True, timeout=30, cwd=str(repo), env=env,
+        ).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _error_result(tf: dict, error: str, output: str, exit_code: int = -1) -> dict:
+    return {
+        "group": tf["group"],
+        "file": tf["file"],
+        "total": 0,
+        "passed": 0,
+        "failed": 0,
+        "errors": [error],
+        "output": output,
+        "exit_code": exit_code,
+    }
 
 
 def _build_env(repo: Path) -> dict:
     """Build environment for subprocess, including the repo's venv if present."""
-    import os
     env = os.environ.copy()
     venv = repo / ".venv"
     if venv.exists():
@@ -129,27 +340,3 @@ def _build_env(repo: Path) -> dict:
         env["PATH"] = f"{venv / 'bin'}:{env.get('PATH', '')}"
     env["PYTHONDONTWRITEBYTECODE"] = "1"
     return env
-
-
-def _parse_pytest_output(output: str) -> tuple[int, int, list[str]]:
-    """Parse pytest output to extract pass/fail counts."""
-    passed = 0
-    failed = 0
-    errors = []
-
-    for line in output.splitlines():
-        line_lower = line.lower().strip()
-        if " passed" in line_lower and ("failed" in line_lower or "passed" in line_lower):
-            # Summary line like "5 passed, 2 failed"
-            import re
-            p = re.search(r"(\d+)\s+passed", line_lower)
-            f = re.search(r"(\d+)\s+failed", line_lower)
-            if p:
-                passed = int(p.group(1))
-            if f:
-                failed = int(f.group(1))
-        elif line_lower.startswith("failed") or "error" in line_lower:
-            if line.strip():
-                errors.append(line.strip())
-
-    return passed, failed, errors
@@ -1,6 +1,6 @@
 """
 Activity: Update Documentation — regenerates specification.md, graph.md,
-and architecture.md after code changes have been applied and merged.
+and architecture.md, re-analyzing the repo when code changes were applied.
 """
 
 from __future__ import annotations
@@ -9,14 +9,33 @@ import logging
 from pathlib import Path
 
 from activities.analyze import analyze_repo
+from utils.repo_scanner import rescan_files
 
 log = logging.getLogger(__name__)
 
 
-def update_docs(repo_path: str) -> list[str]:
+def update_docs(
+    repo_path: str,
+    analysis: dict | None = None,
+    changed_files: list[str] | None = None,
+    scan: dict | None = None,
+) -> list[str]:
     """
     Regenerate the three documentation files in the target repo's docs/ directory.
 
+    Args:
+        analysis: Output of an earlier analyze_repo() call for this repo. When
+            given, it is written as-is instead of re-scanning and re-prompting.
+        changed_files: Repo-relative paths changed since `analysis` was made.
+            When non-empty, `analysis` is stale and the repo is re-analyzed
+            instead.
+        scan: The scan_repo() result `analysis` was made from. With
+            changed_files, only those files are re-read into it rather than
+            scanning the whole repo again.
+
+    Files whose content is already current are left untouched (no rewrite,
+    so git has nothing to re-hash), and are not listed as updated.
+
     Returns:
         List of updated file paths.
     """
@@ -25,7 +44,10 @@ def update_docs(repo_path: str) -> list[str]:
     docs_dir = repo / "docs"
     docs_dir.mkdir(exist_ok=True)
 
-    analysis = analyze_repo(repo_path)
+    if changed_files and scan is not None:
+        analysis = analyze_repo(repo_path, scan=rescan_files(repo_path, scan, changed_files))
+    elif analysis is None or changed_files:
+        analysis = analyze_repo(repo_path)
 
     updated = []
     for name, key in [
@@ -36,6 +58,9 @@ def update_docs(repo_path: str) -> list[str]:
         file_path = docs_dir / name
         content = analysis.get(key, "")
         if content:
+            if _read(file_path) == content:
+                log.info("Unchanged: %s", name)
+                continue
             file_path.write_text(content)
             updated.append(str(file_path.relative_to(repo)))
             log.info("Updated: %s (%d chars)", name, len(content))
@@ -43,3 +68,10 @@ def update_docs(repo_path: str) -> list[str]:
             log.warning("No content generated for %s", name)
 
     return updated
+
+
+def _read(path: Path) -> str | None:
+    try:
+        return path.read_text()
+    except (OSError, UnicodeDecodeError):
+        return None
@@ -11,21 +11,43 @@ Endpoints:
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
+import time
+import uuid
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
 from pathlib import Path
 from typing import Any
 
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 import config
 from temporalio.client import Client
 from workflows.pipeline import CodeImprovementPipeline
+# Activities are imported here rather than inside the handlers so their
+# dependencies (openai, httpx, ...) load at boot, not on the first request
+from activities.analyze import analyze_repo
+from activities.suggest import suggest_improvements
+from activities.execute_changes import execute_changes
+from activities.review import review_changes
+from activities.test_gen import generate_tests
+from activities.test_run import run_tests
+from activities.git_ops import (
+    create_branch, commit_changes, push_branch,
+    create_merge_request, auto_merge, checkout_main, _git,
+)
+from activities.update_docs import update_docs
+from activities.scaffold import scaffold_repo
 from features.beads import db as bead_db
+from features.beads.tracker import BeadTracker
+from utils.repo_scanner import rescan_files, scan_repo
+from utils.run_log import append_entry, list_runs, load_run, write_meta
 
 load_dotenv()
 
@@ -44,7 +66,7 @@ async def lifespan(app: FastAPI):
     global temporal_client
     # Initialize Postgres
     try:
-        bead_db.init_db()
+        await _db(bead_db.init_db)
         log.info("Postgres database initialized")
     except Exception as e:
         log.warning("Could not connect to Postgres: %s (beads will be in-memory only)", e)
@@ -56,6 +78,34 @@ async def lifespan(app: FastAPI):
         log.warning("Could not connect to Temporal: %s (pipeline will run in-process)", e)
         temporal_client = None
     yield
+    bead_db.close_pool()
+
+
+async def _db(fn, *args):
+    """Run a blocking bead_db call on the executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _json_default(obj: Any) -> Any:
+    """orjson fallback for types it has no native encoding for (Decimal, Path, ...)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return str(obj)
+
+
+class JSONResponse(ORJSONResponse):
+    """orjson-encoded response that also accepts raw Postgres rows.
+
+    Datetimes are encoded natively in C; returning an instance directly from a
+    handler skips FastAPI's per-key jsonable_encoder walk as well.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_json_default,
+            option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS,
+        )
 
 
 app = FastAPI(
@@ -63,6 +113,7 @@ app = FastAPI(
     description="Autonomous code improvement pipeline with Temporal orchestration and bead tracking",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=JSONResponse,
 )
 
 
@@ -101,13 +152,11 @@ async def scaffold_repository(req: ScaffoldRequest):
     if not Path(repo_path).is_dir():
         raise HTTPException(status_code=400, detail=f"Repository not found: {repo_path}")
 
-    from activities.scaffold import scaffold_repo
     loop = asyncio.get_running_loop()
     result = await loop.run_in_executor(None, scaffold_repo, repo_path)
 
     # Auto-commit if requested and files were created
     if req.commit and result["created"]:
-        from activities.git_ops import commit_changes
         try:
             await loop.run_in_executor(
                 None, commit_changes, repo_path,
@@ -133,8 +182,6 @@ async def start_pipeline(req: PipelineStartRequest):
 
     if temporal_client:
         # Start via Temporal workflow
-        from datetime import datetime, timezone
-        import uuid
         run_id = f"run-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
 
         handle = await temporal_client.start_workflow(
@@ -163,27 +210,16 @@ async def list_pipeline_runs(status: str | None = None, limit: int = 50):
     """List all pipeline runs."""
     # Try Postgres first
     try:
-        runs = bead_db.list_pipeline_runs(limit=limit, status=status)
-        return {"runs": [_serialize(r) for r in runs]}
+        runs = await _db(bead_db.list_pipeline_runs, limit, status)
+        return JSONResponse({"runs": runs})
     except Exception:
         pass
 
-    # Fallback: JSON files
+    # Fallback: run summaries from the local log directory
     config.PIPELINE_RUNS_DIR.mkdir(exist_ok=True)
-    runs = []
-    for log_file in sorted(config.PIPELINE_RUNS_DIR.glob("*.json"), reverse=True):
-        try:
-            with open(log_file) as f:
-                data = json.load(f)
-            runs.append({
-                "run_id": data.get("run_id"),
-                "status": data.get("status"),
-                "started_at": data.get("started_at"),
-                "duration_sec": data.get("duration_sec"),
-                "improvements": len(data.get("improvements", [])),
-            })
-        except Exception:
-            pass
+    runs = await asyncio.get_running_loop().run_in_executor(
+        None, list_runs, config.PIPELINE_RUNS_DIR, limit, status,
+    )
     return {"runs": runs}
 
 
@@ -192,19 +228,21 @@ async def get_pipeline_run(run_id: str):
     """Get the results of a pipeline run."""
     # Check Postgres first
     try:
-        row = bead_db.get_pipeline_run(run_id)
+        row = await _db(bead_db.get_pipeline_run, run_id)
         if row:
-            row["beads"] = bead_db.get_beads_for_run(run_id)
-            row["bead_summary"] = bead_db.get_bead_summary(run_id)
-            return _serialize(row)
+            row["beads"], row["bead_summary"] = await asyncio.gather(
+                _db(bead_db.get_beads_for_run, run_id),
+                _db(bead_db.get_bead_summary, run_id),
+            )
+            return JSONResponse(row)
     except Exception:
         pass
 
     # Fallback: check local log file
-    log_file = config.PIPELINE_RUNS_DIR / f"{run_id}.json"
-    if log_file.exists():
-        with open(log_file) as f:
-            return json.load(f)
+    for suffix in (".jsonl", ".json"):
+        log_file = config.PIPELINE_RUNS_DIR / f"{run_id}{suffix}"
+        if log_file.exists():
+            return load_run(log_file)
 
     # Check Temporal if connected
     if temporal_client:
@@ -232,12 +270,12 @@ async def get_beads(run_id: str, status: str | None = None, category: str | None
     """Get all beads for a pipeline run, with optional filters."""
     try:
         if status:
-            beads = bead_db.get_beads_by_status(status, run_id=run_id)
+            beads = await _db(bead_db.get_beads_by_status, status, run_id)
         elif category:
-            beads = bead_db.get_beads_by_category(category, run_id=run_id)
+            beads = await _db(bead_db.get_beads_by_category, category, run_id)
         else:
-            beads = bead_db.get_beads_for_run(run_id)
-        return {"run_id": run_id, "beads": [_serialize(b) for b in beads], "count": len(beads)}
+            beads = await _db(bead_db.get_beads_for_run, run_id)
+        return JSONResponse({"run_id": run_id, "beads": beads, "count": len(beads)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
@@ -246,8 +284,8 @@ async def get_beads(run_id: str, status: str | None = None, category: str | None
 async def get_bead_summary(run_id: str):
     """Get an aggregate summary of beads for a run."""
     try:
-        summary = bead_db.get_bead_summary(run_id)
-        return {"run_id": run_id, **_serialize(summary)}
+        summary = await _db(bead_db.get_bead_summary, run_id)
+        return JSONResponse({"run_id": run_id, **summary})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
@@ -256,49 +294,22 @@ async def get_bead_summary(run_id: str):
 async def get_single_bead(bead_id: str):
     """Get a single bead by ID."""
     try:
-        bead = bead_db.get_bead(bead_id)
+        bead = await _db(bead_db.get_bead, bead_id)
         if not bead:
             raise HTTPException(status_code=404, detail=f"Bead not found: {bead_id}")
-        return _serialize(bead)
+        return JSONResponse(bead)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 
-def _serialize(obj: Any) -> Any:
-    """Make a dict JSON-serializable (handle datetimes, Decimals, etc)."""
-    if isinstance(obj, dict):
-        return {k: _serialize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_serialize(v) for v in obj]
-    if hasattr(obj, "isoformat"):
-        return obj.isoformat()
-    return obj
-
-
 # ── In-process pipeline (fallback when Temporal is not available) ─────
 
 async def _run_pipeline_inprocess(repo_path: str) -> str:
     """Run the full pipeline in-process without Temporal."""
-    import time
-    import uuid
-    from datetime import datetime, timezone
-
-    from activities.analyze import analyze_repo
-    from activities.suggest import suggest_improvements
-    from activities.execute_changes import execute_changes
-    from activities.review import review_changes
-    from activities.test_gen import generate_tests
-    from activities.test_run import run_tests
-    from activities.git_ops import (
-        create_branch, commit_changes, push_branch,
-        create_merge_request, auto_merge, checkout_main,
-    )
-    from activities.update_docs import update_docs
-    from features.beads.tracker import BeadTracker
-
-    run_id = f"run-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    started = datetime.now(timezone.utc)
+    run_id = f"run-{started.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
     branch_name = f"{config.IMPROVEMENT_BRANCH_PREFIX}/{run_id}"
     tracker = BeadTracker(run_id)
     pipeline_start = time.monotonic()
@@ -307,46 +318,63 @@ async def _run_pipeline_inprocess(repo_path: str) -> str:
         "run_id": run_id,
         "target_repo": repo_path,
         "branch_name": branch_name,
-        "started_at": datetime.now(timezone.utc).isoformat(),
+        "started_at": started.isoformat(),
         "status": "running",
     }
 
     # Persist initial run record to Postgres
     try:
-        bead_db.upsert_pipeline_run(run_record)
+        await _db(bead_db.upsert_pipeline_run, run_record)
     except Exception as e:
         log.warning("Could not persist run to Postgres: %s", e)
 
     loop = asyncio.get_running_loop()
 
+    # Each step appends its fields to the run log as it finishes, so a crash
+    # mid-run still leaves a readable record behind
+    config.PIPELINE_RUNS_DIR.mkdir(exist_ok=True)
+    log_path = config.PIPELINE_RUNS_DIR / f"{run_id}.jsonl"
+
+    async def log_step(step: str, **data: Any) -> None:
+        run_record.update(data)
+        await loop.run_in_executor(None, append_entry, log_path, step, data)
+
+    await log_step("start", **run_record)
+    await loop.run_in_executor(None, write_meta, config.PIPELINE_RUNS_DIR, run_record)
+
     try:
-        # Step 1: Analyze
-        bead = tracker.create("Analyze Repository", "analysis")
-        tracker.start(bead)
-        analysis = await loop.run_in_executor(None, analyze_repo, repo_path)
-        tracker.complete(bead, output_summary=f"{analysis['stats']['total_files']} files scanned")
-        run_record["repo_analysis"] = {"stats": analysis["stats"]}
-
-        # Write initial docs
-        repo = Path(repo_path)
-        docs_dir = repo / "docs"
-        docs_dir.mkdir(exist_ok=True)
-        for name, key in [("specification.md", "specification"), ("graph.md", "graph"), ("architecture.md", "architecture")]:
-            content = analysis.get(key, "")
-            if content:
-                (docs_dir / name).write_text(content)
-
-        # Step 2: Suggest Improvements
-        bead = tracker.create("Suggest Improvements", "suggestions")
-        tracker.start(bead)
-        improvements = await loop.run_in_executor(None, suggest_improvements, repo_path)
-        tracker.complete(bead, output_summary=f"{len(improvements)} improvements")
-        run_record["improvements"] = improvements
+        # Steps 1 + 2: Analyze, Suggest Improvements — independent, so they
+        # run concurrently. One scan serves both; after changes are applied
+        # only the touched files are re-read for test generation and docs
+        scan = await loop.run_in_executor(None, scan_repo, repo_path)
+
+        async def analyze_step() -> dict:
+            bead = tracker.create("Analyze Repository", "analysis")
+            tracker.start(bead)
+            analysis = await loop.run_in_executor(None, analyze_repo, repo_path, scan)
+            tracker.complete(bead, output_summary=f"{analysis['stats']['total_files']} files scanned")
+            return analysis
+
+        async def suggest_step() -> list[dict]:
+            bead = tracker.create("Suggest Improvements", "suggestions")
+            tracker.start(bead)
+            improvements = await loop.run_in_executor(None, suggest_improvements, repo_path, scan)
+            tracker.complete(bead, output_summary=f"{len(improvements)} improvements")
+            return improvements
+
+        analysis, improvements = await asyncio.gather(analyze_step(), suggest_step())
+        await log_step("analyze", repo_analysis={"stats": analysis["stats"]})
+        await log_step("suggest", improvements=improvements)
+
+        # Write initial docs (off the event loop; unchanged docs are skipped)
+        await loop.run_in_executor(None, update_docs, repo_path, analysis)
 
         # Step 3: Log tasks as beads
+        task_beads = {}  # improvement id → its task bead
         for imp in improvements:
-            task_bead = tracker.create(f"Task: {imp['title']}", imp["category"])
-            task_bead.metadata["improvement_id"] = imp["id"]
+            task_beads[imp["id"]] = tracker.create(
+                f"Task: {imp['title']}", imp["category"], metadata={"improvement_id": imp["id"]},
+            )
 
         # Step 4: Create branch + execute changes
         bead_branch = tracker.create("Create Branch", "git")
@@ -357,47 +385,65 @@ async def _run_pipeline_inprocess(repo_path: str) -> str:
         bead = tracker.create("Execute Code Changes", "execution")
         tracker.start(bead)
         applied_changes = await loop.run_in_executor(None, execute_changes, repo_path, improvements)
-        applied_count = sum(1 for c in applied_changes if c["status"] == "applied")
+        applied: list[dict] = []
+        applied_ids: set[str] = set()
+        for c in applied_changes:
+            if c["status"] == "applied":
+                applied.append(c)
+                applied_ids.add(c["improvement_id"])
+        applied_count = len(applied)
+        changed = [c["file"] for c in applied]
         tracker.complete(bead, output_summary=f"{applied_count} applied")
-        run_record["code_changes"] = applied_changes
+        await log_step("execute", code_changes=applied_changes)
 
         # Mark task beads
-        for tb in tracker.beads:
-            imp_id = tb.metadata.get("improvement_id")
-            if imp_id:
-                applied = any(c["improvement_id"] == imp_id and c["status"] == "applied" for c in applied_changes)
-                if applied:
-                    tracker.complete(tb, output_summary="Applied")
-                else:
-                    tracker.skip(tb, "No changes applied")
+        for imp_id, tb in task_beads.items():
+            if imp_id in applied_ids:
+                tracker.complete(tb, output_summary="Applied")
+            else:
+                tracker.skip(tb, "No changes applied")
 
         # Commit
         await loop.run_in_executor(None, commit_changes, repo_path,
                                    f"repo-pilot: apply {applied_count} improvements ({run_id})")
 
-        # Step 5: Code Review
-        bead = tracker.create("Code Review", "review")
-        tracker.start(bead)
-        review = await loop.run_in_executor(None, review_changes, repo_path, applied_changes)
+        # Steps 5 + 6: Code Review, Generate Tests — both only read the
+        # committed changes, so they run concurrently
+        async def review_step() -> dict:
+            bead = tracker.create("Code Review", "review")
+            tracker.start(bead)
+            review = await loop.run_in_executor(None, review_changes, repo_path, applied_changes)
+            tracker.complete(bead, output_summary=f"Score: {review.get('overall_score', 0)}/10")
+            return review
+
+        async def test_gen_step() -> list[dict]:
+            bead = tracker.create("Generate Tests", "testing")
+            tracker.start(bead)
+            rescanned = await loop.run_in_executor(None, rescan_files, repo_path, scan, changed)
+            test_files = await loop.run_in_executor(None, generate_tests, repo_path, improvements, applied_changes, rescanned)
+            tracker.complete(bead, output_summary=f"{sum(t['test_count'] for t in test_files)} tests")
+            return test_files
+
+        review, test_files = await asyncio.gather(review_step(), test_gen_step())
         score = review.get("overall_score", 0)
-        tracker.complete(bead, output_summary=f"Score: {score}/10")
-        run_record["review"] = review
-
-        # Step 6: Generate Tests
-        bead = tracker.create("Generate Tests", "testing")
-        tracker.start(bead)
-        test_files = await loop.run_in_executor(None, generate_tests, repo_path, improvements, applied_changes)
-        tracker.complete(bead, output_summary=f"{sum(t['test_count'] for t in test_files)} tests")
-        run_record["tests_generated"] = [{"group": t["group"], "file": t["file"], "test_count": t["test_count"]} for t in test_files]
+        await log_step("review", review=review)
+        await log_step("test_gen", tests_generated=[{"group": t["group"], "file": t["file"], "test_count": t["test_count"]} for t in test_files])
 
-        # Step 7: Execute Tests
+        # Step 7: Execute Tests — only written, not run, when the review
+        # score already rules out auto-merge
+        execute_tests = score >= config.AUTO_MERGE_THRESHOLD or config.RUN_TESTS_ON_FAIL
         bead = tracker.create("Execute Tests", "testing")
         tracker.start(bead)
-        test_results = await loop.run_in_executor(None, run_tests, repo_path, test_files)
+        test_results = await loop.run_in_executor(None, run_tests, repo_path, test_files, execute_tests)
         total_passed = sum(r["passed"] for r in test_results)
         total_failed = sum(r["failed"] for r in test_results)
-        tracker.complete(bead, output_summary=f"{total_passed} passed, {total_failed} failed")
-        run_record["test_results"] = test_results
+        if execute_tests:
+            tracker.complete(bead, output_summary=f"{total_passed} passed, {total_failed} failed")
+            tests_line = f"{total_passed} passed, {total_failed} failed"
+        else:
+            tracker.skip(bead, f"Review score {score} below threshold {config.AUTO_MERGE_THRESHOLD}")
+            tests_line = "not run (review score below auto-merge threshold)"
+        await log_step("test_run", test_results=test_results)
 
         # Commit tests
         await loop.run_in_executor(None, commit_changes, repo_path,
@@ -413,16 +459,18 @@ async def _run_pipeline_inprocess(repo_path: str) -> str:
             f"**Run ID:** `{run_id}`\n"
             f"**Improvements:** {applied_count}\n"
             f"**Review Score:** {score}/10\n"
-            f"**Tests:** {total_passed} passed, {total_failed} failed\n"
+            f"**Tests:** {tests_line}\n"
         )
         pr_result = await loop.run_in_executor(
             None, create_merge_request, repo_path, branch_name,
             f"repo-pilot: {applied_count} improvements ({run_id})", pr_body,
         )
 
-        merge_result = await loop.run_in_executor(None, auto_merge, repo_path, score)
+        merge_result = await loop.run_in_executor(
+            None, auto_merge, repo_path, score, config.AUTO_MERGE_THRESHOLD, pr_result.get("url"),
+        )
         tracker.complete(bead, output_summary=f"PR: {pr_result.get('status')}, Merge: {merge_result['status']}")
-        run_record["merge_result"] = {**pr_result, **merge_result}
+        await log_step("merge", merge_result={**pr_result, **merge_result})
 
         if merge_result["status"] == "merged":
             await loop.run_in_executor(None, checkout_main, repo_path)
@@ -430,16 +478,18 @@ async def _run_pipeline_inprocess(repo_path: str) -> str:
         # Step 9: Update docs
         bead = tracker.create("Update Documentation", "documentation")
         tracker.start(bead)
-        updated_docs = await loop.run_in_executor(None, update_docs, repo_path)
+        updated_docs = await loop.run_in_executor(None, update_docs, repo_path, analysis,
+                                                  changed, scan)
         tracker.complete(bead, output_summary=f"Updated {len(updated_docs)} docs")
-        run_record["docs_updated"] = updated_docs
-
-        await loop.run_in_executor(None, commit_changes, repo_path,
-                                   f"repo-pilot: update docs ({run_id})")
+        await log_step("update_docs", docs_updated=updated_docs)
 
-        if merge_result["status"] == "merged":
-            from activities.git_ops import _git
-            await loop.run_in_executor(None, _git, repo_path, "push", "origin", "main")
+        # Without applied changes the docs match what step 1 wrote; skip the
+        # commit and push then
+        if updated_docs:
+            docs_commit = await loop.run_in_executor(None, commit_changes, repo_path,
+                                                     f"repo-pilot: update docs ({run_id})")
+            if merge_result["status"] == "merged" and docs_commit["status"] == "committed":
+                await loop.run_in_executor(None, _git, repo_path, "push", "origin", "main")
 
         run_record["status"] = "completed"
 
@@ -449,21 +499,23 @@ async def _run_pipeline_inprocess(repo_path: str) -> str:
         run_record["error"] = str(e)
 
     # Finalize
-    run_record["completed_at"] = datetime.now(timezone.utc).isoformat()
-    run_record["duration_sec"] = round(time.monotonic() - pipeline_start, 2)
-    run_record["beads"] = tracker.to_list()
-    run_record["bead_summary"] = tracker.summary()
-
-    # Save log (JSON file)
-    config.PIPELINE_RUNS_DIR.mkdir(exist_ok=True)
-    log_path = config.PIPELINE_RUNS_DIR / f"{run_id}.json"
-    with open(log_path, "w") as f:
-        json.dump(run_record, f, indent=2, default=str)
+    beads, bead_summary = tracker.finalize()
+    final = {
+        "status": run_record["status"],
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "duration_sec": round(time.monotonic() - pipeline_start, 2),
+        "beads": beads,
+        "bead_summary": bead_summary,
+    }
+    if "error" in run_record:
+        final["error"] = run_record["error"]
+    await log_step("finish", **final)
+    await loop.run_in_executor(None, write_meta, config.PIPELINE_RUNS_DIR, run_record)
     run_record["log_file"] = str(log_path)
 
     # Persist final run record to Postgres
     try:
-        bead_db.upsert_pipeline_run(run_record)
+        await _db(bead_db.upsert_pipeline_run, run_record)
     except Exception as e:
         log.warning("Could not persist final run to Postgres: %s", e)
 
@@ -1,7 +0,0 @@
-"""
-Backward-compatibility shim — beads.tracker has moved to features.beads.tracker.
-
-All symbols are re-exported from the new location.
-"""
-
-from features.beads.tracker import BeadTracker  # noqa: F401
@@ -5,19 +5,25 @@ Tables:
   pipeline_runs  — one row per pipeline execution
   beads          — one row per bead, FK to pipeline_runs
 
-Every bead state change (create/start/complete/fail/skip) is persisted
-immediately so the audit trail survives crashes.
+Bead state changes (create/start/complete/fail/skip) arrive from the tracker
+in write-behind batches, each written as one multi-row upsert (via COPY into
+a temp table for large batches). Failures are flushed synchronously and
+anything still buffered is flushed on summary() and at interpreter exit, so
+a hard crash loses only the changes made since the last flush.
 """
 
 from __future__ import annotations
 
-import json
+import io
 import logging
+import threading
 from contextlib import contextmanager
 from typing import Any
 
+import orjson
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 
 import config
 
@@ -25,34 +31,61 @@ log = logging.getLogger(__name__)
 
 # ── Connection ────────────────────────────────────────────────────────
 
-_pool: list[Any] = []
+# Connections are pooled and handed out one per cursor, so API handlers and
+# pipeline threads don't serialize on (or reconnect) a single connection.
+# ThreadedConnectionPool raises instead of waiting when it runs dry; the
+# semaphore makes callers wait for a free connection instead.
+_pool: psycopg2.pool.ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(config.DB_POOL_MAX)
+
+
+def _get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Create the connection pool on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                config.DB_POOL_MIN, config.DB_POOL_MAX, config.DATABASE_URL,
+            )
+        return _pool
 
 
-def _get_conn():
-    """Get a Postgres connection (simple single-connection reuse)."""
-    if _pool:
-        conn = _pool[0]
-        try:
-            conn.isolation_level  # cheap liveness check
-            return conn
-        except Exception:
-            _pool.clear()
-
-    conn = psycopg2.connect(config.DATABASE_URL)
-    conn.autocommit = True
-    _pool.append(conn)
-    return conn
+def close_pool() -> None:
+    """Close every pooled connection (called on app shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
 
 
 @contextmanager
 def get_cursor():
-    """Yield a dict cursor, handling errors gracefully."""
-    conn = _get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        yield cur
-    finally:
-        cur.close()
+    """Yield a dict cursor on a pooled connection, handling errors gracefully."""
+    with _pool_slots:
+        pool = _get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            if not conn.autocommit:
+                conn.autocommit = True
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            try:
+                yield cur
+            finally:
+                cur.close()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Drop the connection rather than hand a dead one to the next caller
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+
+def jsonb(obj: Any) -> str:
+    """Encode a value as JSON text for a JSONB column."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
 
 
 # ── Schema ────────────────────────────────────────────────────────────
@@ -81,6 +114,7 @@ CREATE TABLE IF NOT EXISTS pipeline_runs (
 CREATE TABLE IF NOT EXISTS beads (
     id              TEXT PRIMARY KEY,
     run_id          TEXT NOT NULL REFERENCES pipeline_runs(run_id) ON DELETE CASCADE,
+    seq             INTEGER,
     name            TEXT NOT NULL,
     category        TEXT NOT NULL,
     status          TEXT NOT NULL DEFAULT 'pending',
@@ -95,7 +129,12 @@ CREATE TABLE IF NOT EXISTS beads (
     updated_at      TIMESTAMPTZ DEFAULT now()
 );
 
+-- Position in the run's bead chain. Beads flushed in one batch share a
+-- created_at, so reads order by this instead
+ALTER TABLE beads ADD COLUMN IF NOT EXISTS seq INTEGER;
+
 CREATE INDEX IF NOT EXISTS idx_beads_run_id ON beads(run_id);
+CREATE INDEX IF NOT EXISTS idx_beads_run_seq ON beads(run_id, seq);
 CREATE INDEX IF NOT EXISTS idx_beads_status ON beads(status);
 CREATE INDEX IF NOT EXISTS idx_beads_category ON beads(category);
 CREATE INDEX IF NOT EXISTS idx_pipeline_runs_status ON pipeline_runs(status);
@@ -152,13 +191,13 @@ def upsert_pipeline_run(run: dict) -> None:
             "completed_at": run.get("completed_at"),
             "duration_sec": run.get("duration_sec"),
             "error": run.get("error"),
-            "improvements": json.dumps(run.get("improvements", [])),
-            "code_changes": json.dumps(run.get("code_changes", [])),
-            "review": json.dumps(run.get("review", {})),
-            "test_results": json.dumps(run.get("test_results", [])),
-            "merge_result": json.dumps(run.get("merge_result", {})),
-            "docs_updated": json.dumps(run.get("docs_updated", [])),
-            "repo_analysis": json.dumps(run.get("repo_analysis", {})),
+            "improvements": jsonb(run.get("improvements", [])),
+            "code_changes": jsonb(run.get("code_changes", [])),
+            "review": jsonb(run.get("review", {})),
+            "test_results": jsonb(run.get("test_results", [])),
+            "merge_result": jsonb(run.get("merge_result", {})),
+            "docs_updated": jsonb(run.get("docs_updated", [])),
+            "repo_analysis": jsonb(run.get("repo_analysis", {})),
             "log_file": run.get("log_file", ""),
         })
 
@@ -189,49 +228,129 @@ def list_pipeline_runs(limit: int = 50, status: str | None = None) -> list[dict]
 
 # ── Bead CRUD ─────────────────────────────────────────────────────────
 
+# Column order of the row tuples accepted by upsert_bead_rows
+BEAD_COLUMNS = (
+    "id", "run_id", "seq", "name", "category", "status",
+    "started_at", "completed_at", "duration_sec",
+    "input_summary", "output_summary", "error", "metadata",
+)
+
+_BEAD_COLUMN_LIST = ", ".join(BEAD_COLUMNS)
+
+_BEAD_CONFLICT_SQL = """
+    ON CONFLICT (id) DO UPDATE SET
+        status = EXCLUDED.status,
+        started_at = EXCLUDED.started_at,
+        completed_at = EXCLUDED.completed_at,
+        duration_sec = EXCLUDED.duration_sec,
+        output_summary = EXCLUDED.output_summary,
+        error = EXCLUDED.error,
+        metadata = EXCLUDED.metadata,
+        updated_at = now()
+"""
+
+UPSERT_BEADS_SQL = f"INSERT INTO beads ({_BEAD_COLUMN_LIST}) VALUES %s" + _BEAD_CONFLICT_SQL
+
+# Row template for execute_values: explicit casts so each multi-row VALUES
+# list is typed up front instead of coerced from unknown literals
+_BEAD_ROW_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s::timestamptz, %s::timestamptz, %s, %s, %s, %s, %s::jsonb)"
+)
+
+# Batches larger than this are COPYed into a temp table and upserted from
+# there in one statement; below it a multi-row INSERT is cheaper than the
+# extra round-trips
+COPY_THRESHOLD = 1024
+
+
 def upsert_bead(run_id: str, bead: dict) -> None:
-    """Insert or update a bead. Called on every state change."""
+    """Insert or update a single bead."""
+    upsert_beads(run_id, [bead])
+
+
+def upsert_beads(run_id: str, beads: list[dict]) -> None:
+    """Insert or update many beads of one run in one batch.
+
+    Bead ids must be unique within the batch (Postgres rejects an upsert that
+    touches the same row twice); callers keep only each bead's latest state.
+    """
+    upsert_bead_rows([
+        (
+            bead.get("id"),
+            run_id,
+            bead.get("seq"),
+            bead.get("name", ""),
+            bead.get("category", ""),
+            bead.get("status", "pending"),
+            bead.get("started_at"),
+            bead.get("completed_at"),
+            bead.get("duration_sec"),
+            bead.get("input_summary", ""),
+            bead.get("output_summary", ""),
+            bead.get("error"),
+            jsonb(bead.get("metadata", {})),
+        )
+        for bead in beads
+    ])
+
+
+def upsert_bead_rows(rows: list[tuple]) -> None:
+    """Upsert pre-built bead rows (BEAD_COLUMNS order, metadata as JSON text)."""
+    if not rows:
+        return
+    if len(rows) > COPY_THRESHOLD:
+        _copy_upsert_beads(rows)
+        return
     with get_cursor() as cur:
-        cur.execute("""
-            INSERT INTO beads (
-                id, run_id, name, category, status,
-                started_at, completed_at, duration_sec,
-                input_summary, output_summary, error, metadata
-            ) VALUES (
-                %(id)s, %(run_id)s, %(name)s, %(category)s, %(status)s,
-                %(started_at)s, %(completed_at)s, %(duration_sec)s,
-                %(input_summary)s, %(output_summary)s, %(error)s, %(metadata)s
+        psycopg2.extras.execute_values(
+            cur, UPSERT_BEADS_SQL, rows, template=_BEAD_ROW_TEMPLATE, page_size=1000,
+        )
+
+
+def _copy_upsert_beads(rows: list[tuple]) -> None:
+    """Bulk upsert via COPY into a transaction-scoped temp table."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(",".join(_csv_field(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+
+    with get_cursor() as cur:
+        # The connection is in autocommit mode; the temp table must live for
+        # the whole load, so run it as one explicit transaction
+        cur.execute("BEGIN")
+        try:
+            cur.execute(
+                "CREATE TEMP TABLE beads_load ON COMMIT DROP AS "
+                f"SELECT {_BEAD_COLUMN_LIST} FROM beads WITH NO DATA"
             )
-            ON CONFLICT (id) DO UPDATE SET
-                status = EXCLUDED.status,
-                started_at = EXCLUDED.started_at,
-                completed_at = EXCLUDED.completed_at,
-                duration_sec = EXCLUDED.duration_sec,
-                output_summary = EXCLUDED.output_summary,
-                error = EXCLUDED.error,
-                metadata = EXCLUDED.metadata,
-                updated_at = now()
-        """, {
-            "id": bead.get("id"),
-            "run_id": run_id,
-            "name": bead.get("name", ""),
-            "category": bead.get("category", ""),
-            "status": bead.get("status", "pending"),
-            "started_at": bead.get("started_at"),
-            "completed_at": bead.get("completed_at"),
-            "duration_sec": bead.get("duration_sec"),
-            "input_summary": bead.get("input_summary", ""),
-            "output_summary": bead.get("output_summary", ""),
-            "error": bead.get("error"),
-            "metadata": json.dumps(bead.get("metadata", {})),
-        })
+            cur.copy_expert(
+                f"COPY beads_load ({_BEAD_COLUMN_LIST}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buf,
+            )
+            cur.execute(
+                f"INSERT INTO beads ({_BEAD_COLUMN_LIST}) "
+                f"SELECT {_BEAD_COLUMN_LIST} FROM beads_load" + _BEAD_CONFLICT_SQL
+            )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+
+def _csv_field(value: Any) -> str:
+    """Encode one COPY CSV field; every non-NULL value is quoted, so only the
+    bare \\N marker reads as NULL."""
+    if value is None:
+        return "\\N"
+    return '"' + str(value).replace('"', '""') + '"'
 
 
 def get_beads_for_run(run_id: str) -> list[dict]:
-    """Fetch all beads for a pipeline run, ordered by creation time."""
+    """Fetch all beads for a pipeline run, in chain order."""
     with get_cursor() as cur:
         cur.execute(
-            "SELECT * FROM beads WHERE run_id = %s ORDER BY created_at ASC",
+            "SELECT * FROM beads WHERE run_id = %s ORDER BY seq, created_at",
             (run_id,),
         )
         return [dict(row) for row in cur.fetchall()]
@@ -250,7 +369,7 @@ def get_beads_by_status(status: str, run_id: str | None = None) -> list[dict]:
     with get_cursor() as cur:
         if run_id:
             cur.execute(
-                "SELECT * FROM beads WHERE status = %s AND run_id = %s ORDER BY created_at ASC",
+                "SELECT * FROM beads WHERE status = %s AND run_id = %s ORDER BY seq, created_at",
                 (status, run_id),
             )
         else:
@@ -266,7 +385,7 @@ def get_beads_by_category(category: str, run_id: str | None = None) -> list[dict
     with get_cursor() as cur:
         if run_id:
             cur.execute(
-                "SELECT * FROM beads WHERE category = %s AND run_id = %s ORDER BY created_at ASC",
+                "SELECT * FROM beads WHERE category = %s AND run_id = %s ORDER BY seq, created_at",
                 (category, run_id),
             )
         else:
@@ -7,7 +7,7 @@ discrete units of work through the pipeline.
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from enum import Enum
 
 
@@ -19,7 +19,9 @@ class BeadStatus(str, Enum):
     SKIPPED = "skipped"
 
 
-@dataclass
+# slots: beads are created and mutated on every pipeline step; a slotted
+# class skips the per-instance __dict__ and has faster attribute access
+@dataclass(slots=True)
 class Bead:
     """A single tracked unit of work in the pipeline."""
     id: str
@@ -33,3 +35,6 @@ class Bead:
     output_summary: str = ""
     error: str | None = None
     metadata: dict = field(default_factory=dict)
+
+
+BEAD_FIELDS = tuple(f.name for f in fields(Bead))
@@ -4,56 +4,183 @@ Bead Tracker — tracks discrete units of work through the pipeline.
 Each "bead" represents a single trackable task. Together they form a chain
 that records the full execution history of a pipeline run.
 
-Every state change is persisted to Postgres in real-time via features.beads.db,
-so the audit trail survives crashes. If the DB is unavailable, the tracker
-falls back to in-memory only (with a warning).
+State changes are written to Postgres via features.beads.db in small
+write-behind batches (one multi-row upsert per flush) rather than one
+round-trip each. A background thread flushes every FLUSH_INTERVAL_SEC (or as
+soon as a batch fills) so pipeline code never waits on the database; failures
+are written synchronously, and anything still buffered is flushed on summary()
+and at interpreter exit. The DB layer
+is imported on first use; if DATABASE_URL is empty or the DB is unavailable,
+the tracker falls back to in-memory only.
 """
 
 from __future__ import annotations
 
+import atexit
+import functools
 import logging
+import math
+import threading
 import time
 import uuid
-from dataclasses import asdict
+import weakref
+from collections import Counter
+from collections.abc import Callable
 from datetime import datetime, timezone
 
-from features.beads.models import Bead, BeadStatus
+import config
+from features.beads.models import BEAD_FIELDS, Bead, BeadStatus
 
 log = logging.getLogger(__name__)
 
-# Try to import the DB layer; gracefully degrade if unavailable
-_db_available = False
-try:
-    from features.beads import db as bead_db
-    _db_available = True
-except Exception:
-    bead_db = None  # type: ignore
+
+@functools.cache
+def _bead_db():
+    """The DB layer, imported on first use; None if disabled or unavailable.
+
+    Deferred so runs without DATABASE_URL never pay for importing psycopg2.
+    """
+    if not config.DATABASE_URL:
+        return None
+    try:
+        from features.beads import db
+    except Exception as e:
+        log.warning("[BEAD] DB layer unavailable, tracking in memory only: %s", e)
+        return None
+    return db
+
+# A background thread flushes buffered bead changes every FLUSH_INTERVAL_SEC,
+# and straight away once a tracker has this many pending
+FLUSH_BATCH_SIZE = 64
+FLUSH_INTERVAL_SEC = 2.0
+
+# Set to wake the flusher before its interval is up. A tracker's flushes are
+# serialized by its own flush lock, so rows land in the order they were buffered
+_flush_wakeup = threading.Event()
+_flusher_lock = threading.Lock()
+_flusher: threading.Thread | None = None
+
+# Trackers with unflushed changes get a final flush at interpreter exit
+_live_trackers: weakref.WeakSet[BeadTracker] = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all() -> None:
+    for tracker in list(_live_trackers):
+        tracker.flush()
+
+
+def _flush_loop() -> None:
+    """Flush every live tracker each FLUSH_INTERVAL_SEC, or when woken early.
+
+    Bounds how long a change (e.g. a step's start during a long activity)
+    sits in the buffer even when no further change arrives.
+    """
+    while True:
+        _flush_wakeup.wait(FLUSH_INTERVAL_SEC)
+        _flush_wakeup.clear()
+        try:
+            _flush_all()
+        except Exception as e:
+            log.warning("[BEAD] Background flush failed: %s", e)
+
+
+def _ensure_flusher() -> None:
+    """Start the background flusher on first use (daemon, so exit never waits)."""
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="bead-flush", daemon=True)
+            _flusher.start()
+
+
+_UTC = timezone.utc
+
+
+def _now() -> str:
+    """Current UTC time for a bead transition, to the second.
+
+    Durations come from time.monotonic(), so sub-second precision here would
+    only add formatting cost on every transition.
+    """
+    return datetime.now(_UTC).isoformat(timespec="seconds")
 
 
 class BeadTracker:
     """Manages a chain of beads for a single pipeline run.
 
-    Persists every state change to Postgres when available.
+    Persists state changes to Postgres in batches when available.
     """
 
     def __init__(self, run_id: str):
         self.run_id = run_id
         self.beads: list[Bead] = []
+        self._seq: dict[str, int] = {}  # bead_id → position in the chain
         self._active: dict[str, float] = {}  # bead_id → start time
+        # Beads changed since the last flush, keyed by id so repeated changes
+        # to one bead collapse into a single row carrying its latest state
+        self._pending: dict[str, Bead] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        _live_trackers.add(self)
 
-    def _persist(self, bead: Bead) -> None:
-        """Persist the current bead state to Postgres."""
-        if not _db_available or bead_db is None:
+    def _persist(self, bead: Bead, force: bool = False) -> None:
+        """Queue the bead's current state for Postgres.
+
+        The background flusher writes it within FLUSH_INTERVAL_SEC, sooner
+        once a full batch is pending; `force` flushes synchronously before
+        returning.
+        """
+        if _bead_db() is None:
             return
-        try:
-            bead_dict = asdict(bead)
-            # Convert BeadStatus enum to string value
-            bead_dict["status"] = bead.status.value if hasattr(bead.status, "value") else str(bead.status)
-            bead_db.upsert_bead(self.run_id, bead_dict)
-        except Exception as e:
-            log.warning("[BEAD] Failed to persist bead %s to DB: %s", bead.id, e)
+        with self._lock:
+            self._pending[bead.id] = bead
+            full = len(self._pending) >= FLUSH_BATCH_SIZE
+        if force:
+            self.flush()
+            return
+        _ensure_flusher()
+        if full:
+            _flush_wakeup.set()
+
+    def flush(self) -> None:
+        """Write every buffered bead change to Postgres in one statement.
+
+        Blocks until any in-flight background flush for this tracker is done.
+        """
+        bead_db = _bead_db()
+        if bead_db is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                beads, self._pending = list(self._pending.values()), {}
+                rows = [self._to_row(b, bead_db.jsonb) for b in beads]
+            try:
+                bead_db.upsert_bead_rows(rows)
+            except Exception as e:
+                log.warning("[BEAD] Failed to persist %d bead(s) to DB: %s", len(rows), e)
 
-    def create(self, name: str, category: str, input_summary: str = "") -> Bead:
+    def _to_row(self, bead: Bead, jsonb: Callable[[dict], str]) -> tuple:
+        """Build the DB row for a bead, in bead_db.BEAD_COLUMNS order.
+
+        Built field by field instead of via asdict(), which deep-copies the
+        whole bead; metadata is encoded here, while the lock is held.
+        """
+        status = bead.status.value if hasattr(bead.status, "value") else str(bead.status)
+        return (
+            bead.id, self.run_id, self._seq[bead.id], bead.name, bead.category, status,
+            bead.started_at, bead.completed_at, bead.duration_sec,
+            bead.input_summary, bead.output_summary, bead.error,
+            jsonb(bead.metadata),
+        )
+
+    def create(
+        self, name: str, category: str, input_summary: str = "", metadata: dict | None = None,
+    ) -> Bead:
         """Create a new bead and add it to the chain."""
         bead = Bead(
             id=f"bead-{uuid.uuid4().hex[:8]}",
@@ -61,7 +188,9 @@ class BeadTracker:
             category=category,
             status=BeadStatus.PENDING,
             input_summary=input_summary,
+            metadata=dict(metadata) if metadata else {},
         )
+        self._seq[bead.id] = len(self.beads)
         self.beads.append(bead)
         log.info("[BEAD] Created: %s — %s (%s)", bead.id, name, category)
         self._persist(bead)
@@ -70,7 +199,7 @@ class BeadTracker:
     def start(self, bead: Bead) -> None:
         """Mark a bead as running."""
         bead.status = BeadStatus.RUNNING
-        bead.started_at = datetime.now(timezone.utc).isoformat()
+        bead.started_at = _now()
         self._active[bead.id] = time.monotonic()
         log.info("[BEAD] Started: %s — %s", bead.id, bead.name)
         self._persist(bead)
@@ -78,7 +207,7 @@ class BeadTracker:
     def complete(self, bead: Bead, output_summary: str = "", metadata: dict | None = None) -> None:
         """Mark a bead as completed."""
         bead.status = BeadStatus.COMPLETED
-        bead.completed_at = datetime.now(timezone.utc).isoformat()
+        bead.completed_at = _now()
         bead.output_summary = output_summary
         if metadata:
             bead.metadata.update(metadata)
@@ -94,13 +223,15 @@ class BeadTracker:
     def fail(self, bead: Bead, error: str) -> None:
         """Mark a bead as failed."""
         bead.status = BeadStatus.FAILED
-        bead.completed_at = datetime.now(timezone.utc).isoformat()
+        bead.completed_at = _now()
         bead.error = error
         start = self._active.pop(bead.id, None)
         if start:
             bead.duration_sec = round(time.monotonic() - start, 2)
         log.error("[BEAD] Failed: %s — %s: %s", bead.id, bead.name, error)
-        self._persist(bead)
+        # Written straight away so the failure is on record even if the
+        # process dies right after
+        self._persist(bead, force=True)
 
     def skip(self, bead: Bead, reason: str = "") -> None:
         """Mark a bead as skipped."""
@@ -110,18 +241,43 @@ class BeadTracker:
         self._persist(bead)
 
     def to_list(self) -> list[dict]:
-        """Export all beads as a list of dicts."""
-        return [asdict(b) for b in self.beads]
+        """Export all beads as a list of dicts.
+
+        A shallow per-field copy (metadata dicts are copied, their values
+        shared) rather than asdict(), which deep-copies every bead.
+        """
+        return [_export(b) for b in self.beads]
 
     def summary(self) -> dict:
-        """Return a summary of the bead chain."""
-        statuses = {}
+        """Return a summary of the bead chain (flushing pending DB writes)."""
+        self.flush()
+        # Counted from the in-memory chain: it always holds every bead, even
+        # when DB writes failed, and is cheaper than a query at these sizes
+        statuses = Counter(b.status.value for b in self.beads)
+        durations = [b.duration_sec for b in self.beads if b.duration_sec]
+        return self._summary(statuses, durations)
+
+    def finalize(self) -> tuple[list[dict], dict]:
+        """Return (to_list(), summary()) from a single pass over the chain."""
+        self.flush()
+        beads: list[dict] = []
+        statuses: Counter[str] = Counter()
+        durations: list[float] = []
         for b in self.beads:
-            statuses[b.status.value] = statuses.get(b.status.value, 0) + 1
-        total_duration = sum(b.duration_sec or 0 for b in self.beads)
+            beads.append(_export(b))
+            statuses[b.status.value] += 1
+            if b.duration_sec:
+                durations.append(b.duration_sec)
+        return beads, self._summary(statuses, durations)
+
+    def _summary(self, statuses: Counter[str], durations: list[float]) -> dict:
         return {
             "run_id": self.run_id,
             "total_beads": len(self.beads),
-            "statuses": statuses,
-            "total_duration_sec": round(total_duration, 2),
+            "statuses": dict(statuses),
+            "total_duration_sec": round(math.fsum(durations), 2),
         }
+
+
+def _export(bead: Bead) -> dict:
+    return {**{name: getattr(bead, name) for name in BEAD_FIELDS}, "metadata": dict(bead.metadata)}
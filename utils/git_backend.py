@@ -0,0 +1,79 @@
+"""
+Git backend — in-process local git operations via libgit2 (pygit2).
+
+Branching, staging, committing and rev-parse run without forking a `git`
+process per call. Network operations (push, pull) and GitHub PR calls stay
+on the CLI. If pygit2 is not installed, AVAILABLE is False and callers fall
+back to the git CLI.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+
+log = logging.getLogger(__name__)
+
+# Try to import libgit2 bindings; gracefully degrade if unavailable
+AVAILABLE = False
+try:
+    import pygit2
+    AVAILABLE = True
+except Exception:
+    pygit2 = None  # type: ignore
+
+
+@functools.lru_cache(maxsize=16)
+def _open(repo_path: str):
+    """Open (and reuse) a Repository handle for a repo path."""
+    return pygit2.Repository(repo_path)
+
+
+def create_branch(repo_path: str, branch_name: str) -> None:
+    """Create a branch at HEAD and check it out."""
+    repo = _open(repo_path)
+    branch = repo.branches.local.create(branch_name, repo.head.peel(pygit2.Commit))
+    repo.checkout(branch)
+
+
+def checkout(repo_path: str, branch_name: str) -> None:
+    """Check out an existing local branch."""
+    repo = _open(repo_path)
+    repo.checkout(repo.branches.local[branch_name])
+
+
+def commit_all(repo_path: str, message: str) -> str | None:
+    """Stage all changes (including deletions) and commit.
+
+    Returns the new commit SHA, or None if there was nothing to commit.
+    """
+    repo = _open(repo_path)
+    if not repo.status():
+        # Clean worktree and index — skip staging and tree writes entirely
+        return None
+
+    index = repo.index
+    index.read()
+    index.add_all()
+    index.write()
+    tree = index.write_tree()
+
+    parents = [] if repo.head_is_unborn else [repo.head.target]
+    if parents and repo[parents[0]].tree_id == tree:
+        return None
+
+    sig = repo.default_signature
+    return str(repo.create_commit("HEAD", sig, sig, message, tree, parents))
+
+
+def current_branch(repo_path: str) -> str | None:
+    """Return the checked-out branch name, or None if HEAD is detached/unborn."""
+    repo = _open(repo_path)
+    if repo.head_is_detached or repo.head_is_unborn:
+        return None
+    return repo.head.shorthand
+
+
+def rev_parse_head(repo_path: str) -> str:
+    """Return the SHA of HEAD."""
+    return str(_open(repo_path).head.target)
@@ -4,27 +4,231 @@ OpenAI LLM helpers — shared across all activities.
 
 from __future__ import annotations
 
+import contextvars
+import functools
+import hashlib
 import json
 import logging
+import random
+import threading
 import time
-from openai import OpenAI, RateLimitError
+from collections.abc import Callable, Iterable
+from concurrent.futures import Executor, Future
+from typing import IO
+
+import httpx
+from openai import APIConnectionError, APITimeoutError, OpenAI, RateLimitError
 
 import config
 
 log = logging.getLogger(__name__)
 
+# Exact token counting is optional; fall back to the ~4 chars/token estimate
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None  # type: ignore
+
+# orjson parses model JSON several times faster; stdlib json is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:
+    _json_loads = json.loads
+
 _client: OpenAI | None = None
+_client_lock = threading.Lock()
+
+
+# How long idle pooled connections are kept. httpx defaults to 5s, which
+# drops them between the sequential stages of a pipeline run.
+KEEPALIVE_EXPIRY_SEC = 120.0
 
 
 def get_client() -> OpenAI:
+    """Return the shared OpenAI client.
+
+    The client owns one HTTP/2 connection pool, so concurrent calls from
+    worker threads multiplex over kept-alive connections instead of paying a
+    TLS handshake per request.
+    """
     global _client
     if _client is None:
-        _client = OpenAI(api_key=config.OPENAI_API_KEY)
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=config.OPENAI_API_KEY,
+                    http_client=httpx.Client(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=64,
+                            max_keepalive_connections=32,
+                            keepalive_expiry=KEEPALIVE_EXPIRY_SEC,
+                        ),
+                        timeout=httpx.Timeout(600.0, connect=10.0),
+                    ),
+                )
     return _client
 
 
+@functools.lru_cache(maxsize=4)
+def _encoding(model: str):
+    """Return the tiktoken encoding for `model`, or None if it can't be loaded."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The BPE file is downloaded on first use, which fails offline
+        log.warning("tiktoken encoding unavailable for %s (%s) — estimating token counts", model, e)
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Count prompt tokens for a model (estimated if tiktoken is unavailable)."""
+    enc = _encoding(model or config.OPENAI_MODEL) if tiktoken is not None else None
+    if enc is None:
+        return len(text) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
 MAX_RETRIES = 5
 BASE_DELAY = 10  # seconds
+MAX_DELAY = 120  # seconds; cap on any single backoff (incl. Retry-After)
+
+# Transient failures worth retrying: rate limits, plus timeouts and dropped
+# connections that outlast the SDK's own quick retries
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError)
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Backoff before retry number `attempt` (0-based).
+
+    Honors the server's Retry-After when given; otherwise exponential with
+    jitter (half fixed, half random) so concurrent callers that were throttled
+    together don't all retry in the same instant.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), MAX_DELAY)
+    except ValueError:
+        pass
+    delay = min(BASE_DELAY * (2 ** attempt), MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _wait_for_retry(attempt: int, error: Exception) -> None:
+    """Sleep before the next attempt, or re-raise after the last one."""
+    if attempt == MAX_RETRIES - 1:
+        raise error
+    delay = _retry_delay(attempt, error)
+    log.warning(
+        "%s (attempt %d/%d), retrying in %.1fs: %s",
+        type(error).__name__, attempt + 1, MAX_RETRIES, delay, error,
+    )
+    time.sleep(delay)
+
+
+class RateLimiter:
+    """Thread-safe token bucket capping LLM requests per minute."""
+
+    def __init__(self, max_per_minute: int):
+        self.capacity = max(1, max_per_minute)
+        self.rate = self.capacity / 60.0  # tokens per second
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request slot is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiter = RateLimiter(config.LLM_MAX_REQUESTS_PER_MINUTE)
+
+
+class CostMeter:
+    """Accumulates token usage and latency of the LLM calls made inside it.
+
+        with CostMeter("scaffold") as meter:
+            ...
+        result["cost_report"] = meter.report()
+
+    The active meter lives in a context variable, so calls made from worker
+    threads are counted when the work runs in a copy of the caller's context
+    (contextvars.copy_context().run).
+    """
+
+    def __init__(self, activity: str):
+        self.activity = activity
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.llm_ms = 0
+        self.wall_ms = 0
+        self._lock = threading.Lock()
+        self._token = None
+        self._started = 0.0
+
+    def __enter__(self) -> "CostMeter":
+        self._started = time.monotonic()
+        self._token = _active_meter.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _active_meter.reset(self._token)
+        self.wall_ms = int((time.monotonic() - self._started) * 1000)
+        log.info(
+            "LLM cost [%s]: %d calls, %d prompt tokens (%d cached), %d completion tokens, "
+            "%d ms in LLM calls, %d ms wall",
+            self.activity, self.calls, self.prompt_tokens, self.cached_tokens,
+            self.completion_tokens, self.llm_ms, self.wall_ms,
+        )
+
+    def record(self, usage, elapsed_ms: int) -> None:
+        """Add one call's usage (an OpenAI CompletionUsage, possibly None)."""
+        with self._lock:
+            self.calls += 1
+            self.llm_ms += elapsed_ms
+            if usage is None:
+                return
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    def report(self) -> dict:
+        return {
+            "activity": self.activity,
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_ms": self.llm_ms,
+            "wall_ms": self.wall_ms,
+        }
+
+
+_active_meter: contextvars.ContextVar[CostMeter | None] = contextvars.ContextVar("llm_cost_meter", default=None)
+
+
+def _record_usage(usage, started: float) -> None:
+    meter = _active_meter.get()
+    if meter is not None:
+        meter.record(usage, int((time.monotonic() - started) * 1000))
 
 
 def chat(
@@ -34,47 +238,223 @@ def chat(
     json_mode: bool = False,
     temperature: float = 0.3,
     max_tokens: int = 4096,
+    cache_segments: list[str] | None = None,
+    json_schema: dict | None = None,
+    use_cache: bool = True,
 ) -> str:
     """Send a chat completion request and return the assistant message.
     
-    Retries up to MAX_RETRIES times on rate limit (429) errors with
-    exponential backoff.
+    Requests are throttled by a shared token bucket so concurrent callers
+    stay under LLM_MAX_REQUESTS_PER_MINUTE. Retries up to MAX_RETRIES times
+    on rate limits, timeouts and connection errors, with jittered exponential
+    backoff (or the server's Retry-After).
+
+    ``cache_segments`` are large blocks shared between calls (e.g. repo
+    context). They are sent as the leading messages, ahead of the per-call
+    system prompt, so identical prefixes hit OpenAI's automatic prompt cache.
+
+    ``json_schema`` ({"name": ..., "schema": ...}) requests strict structured
+    output, so the response is guaranteed to conform to the schema.
+
+    An identical earlier request (same model, parameters and messages) made
+    within LLM_CACHE_TTL_SEC is answered from the on-disk response cache;
+    ``use_cache=False`` always calls the API.
     """
+    request = _chat_request(system, user, model, json_mode, temperature, max_tokens, cache_segments, json_schema)
+    return _complete(request, use_cache)
+
+
+def _complete(request: dict, use_cache: bool, accept: Callable[[str], bool] = bool) -> str:
+    """Run a (non-streaming) completion through the response cache and retries.
+
+    Only complete responses (``finish_reason == "stop"``, so never one cut
+    off at max_tokens) that pass ``accept`` (by default: non-empty) are cached.
+    """
+    key = _response_cache_key(request) if use_cache and config.LLM_CACHE_TTL_SEC > 0 else None
+    if key is not None:
+        cached = _response_cache_get(key)
+        if cached is not None:
+            log.info("LLM cache hit: %s", key[:12])
+            return cached
+
     client = get_client()
-    kwargs: dict = {
+    for attempt in range(MAX_RETRIES):
+        _rate_limiter.acquire()
+        try:
+            started = time.monotonic()
+            resp = client.chat.completions.create(**request)
+            _record_usage(resp.usage, started)
+            choice = resp.choices[0]
+            content = choice.message.content or ""
+        except RETRYABLE_ERRORS as e:
+            _wait_for_retry(attempt, e)
+            continue
+        if key is not None and choice.finish_reason == "stop" and accept(content):
+            _response_cache_put(key, content)
+        return content
+
+    return ""  # unreachable but satisfies type checker
+
+
+# ── Response cache ────────────────────────────────────────────────────
+# Pipeline runs re-send identical prompts (re-runs on an unchanged repo,
+# Temporal activity retries, overlapping improvements). Responses are stored
+# in LLM_CACHE_DIR under a hash of the full request; an entry's age is its
+# file mtime, and entries older than LLM_CACHE_TTL_SEC count as misses.
+
+def _response_cache_key(request: dict) -> str:
+    return hashlib.blake2b(json.dumps(request, sort_keys=True).encode(), digest_size=20).hexdigest()
+
+
+def _response_cache_get(key: str) -> str | None:
+    path = config.LLM_CACHE_DIR / f"{key}.txt"
+    try:
+        if time.time() - path.stat().st_mtime > config.LLM_CACHE_TTL_SEC:
+            return None
+        return path.read_text()
+    except OSError:
+        return None
+
+
+def _response_cache_put(key: str, content: str) -> None:
+    try:
+        config.LLM_CACHE_DIR.mkdir(exist_ok=True)
+        tmp = config.LLM_CACHE_DIR / f"{key}.{threading.get_ident()}.tmp"
+        tmp.write_text(content)
+        tmp.replace(config.LLM_CACHE_DIR / f"{key}.txt")
+    except OSError as e:
+        log.warning("Could not write LLM cache entry %s: %s", key[:12], e)
+
+
+def chat_stream(
+    system: str,
+    user: str,
+    sink: IO[str],
+    model: str | None = None,
+    temperature: float = 0.3,
+    max_tokens: int = 4096,
+    cache_segments: list[str] | None = None,
+) -> int:
+    """Like chat(), but write the response into ``sink`` as it streams in.
+
+    Avoids holding large documents in memory and overlaps receiving with
+    writing. Only errors raised before any content is streamed are retried
+    (as in chat()), so retries never produce partial output. Returns the number of characters
+    written.
+    """
+    client = get_client()
+    kwargs = _request_kwargs(system, user, model, temperature, max_tokens, cache_segments)
+
+    for attempt in range(MAX_RETRIES):
+        _rate_limiter.acquire()
+        try:
+            started = time.monotonic()
+            stream = client.chat.completions.create(
+                **kwargs, stream=True, stream_options={"include_usage": True},
+            )
+        except RETRYABLE_ERRORS as e:
+            _wait_for_retry(attempt, e)
+            continue
+
+        written = 0
+        usage = None
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                sink.write(text)
+                written += len(text)
+        _record_usage(usage, started)
+        return written
+
+    return 0  # unreachable but satisfies type checker
+
+
+def _chat_request(
+    system: str,
+    user: str,
+    model: str | None = None,
+    json_mode: bool = False,
+    temperature: float = 0.3,
+    max_tokens: int = 4096,
+    cache_segments: list[str] | None = None,
+    json_schema: dict | None = None,
+) -> dict:
+    """Request arguments for chat(), including the response format."""
+    request = _request_kwargs(system, user, model, temperature, max_tokens, cache_segments)
+    if json_schema:
+        request["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {**json_schema, "strict": True},
+        }
+    elif json_mode:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def _request_kwargs(
+    system: str,
+    user: str,
+    model: str | None,
+    temperature: float,
+    max_tokens: int,
+    cache_segments: list[str] | None,
+) -> dict:
+    """Build chat completion arguments; cache_segments lead the messages."""
+    messages = [{"role": "system", "content": seg} for seg in cache_segments or []]
+    messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": user})
+    return {
         "model": model or config.OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+        "messages": messages,
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
-    if json_mode:
-        kwargs["response_format"] = {"type": "json_object"}
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            resp = client.chat.completions.create(**kwargs)
-            return resp.choices[0].message.content or ""
-        except RateLimitError as e:
-            delay = BASE_DELAY * (2 ** attempt)
-            log.warning(
-                "Rate limited (attempt %d/%d), retrying in %ds: %s",
-                attempt + 1, MAX_RETRIES, delay, e,
-            )
-            if attempt == MAX_RETRIES - 1:
-                raise
-            time.sleep(delay)
 
-    return ""  # unreachable but satisfies type checker
+# Head start for the first of a batch of requests that share cache_segments,
+# so the prefix is cached before the rest of the batch is sent
+CACHE_WARMUP_SEC = 2.0
+
+
+def submit_warmed(ex: Executor, fn: Callable[..., object], calls: Iterable[tuple]) -> list[Future]:
+    """Submit fn(*args) to `ex` for each args tuple in `calls`.
+
+    The first call is sent CACHE_WARMUP_SEC ahead of the rest so they hit the
+    warm prefix cache. Each call runs in a copy of the caller's context, so an
+    active CostMeter sees it. Futures are returned in submission order.
+    """
+    futs = []
+    for i, args in enumerate(calls):
+        if i == 1:
+            time.sleep(CACHE_WARMUP_SEC)
+        futs.append(ex.submit(contextvars.copy_context().run, fn, *args))
+    return futs
+
 
+def chat_json(system: str, user: str, schema: dict | None = None, schema_name: str = "response", **kwargs) -> dict:
+    """Send a chat completion and parse the JSON response.
 
-def chat_json(system: str, user: str, **kwargs) -> dict:
-    """Send a chat completion and parse the JSON response."""
-    raw = chat(system, user, json_mode=True, **kwargs)
+    If ``schema`` is given, the model is constrained to it via structured
+    output instead of free-form JSON mode. Other keyword arguments are as for
+    chat(); responses that fail to parse are never cached.
+    """
+    use_cache = kwargs.pop("use_cache", True)
+    if schema is not None:
+        kwargs["json_schema"] = {"name": schema_name, "schema": schema}
+    request = _chat_request(system, user, json_mode=True, **kwargs)
+    raw = _complete(request, use_cache, accept=_is_json)
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+        return _json_loads(raw)
+    except json.JSONDecodeError:  # orjson's decode error subclasses this
         log.error("Failed to parse LLM JSON response: %s", raw[:500])
         return {"error": "JSON parse failed", "raw": raw[:2000]}
+
+
+def _is_json(raw: str) -> bool:
+    try:
+        _json_loads(raw)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,133 @@
+"""
+Unified diff applier — applies LLM-generated patches to in-memory file content.
+
+Hunks are located by their context/removed lines rather than trusting the
+`@@` line numbers (models often get those wrong); the numbers are only used
+to pick the nearest match when the same context appears more than once.
+"""
+
+from __future__ import annotations
+
+import re
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+# (start_hint, old_lines, new_lines, new_ends_without_eol); each new line is
+# (text, ctx) where ctx indexes old_lines for a context line, None if added
+_Hunk = tuple[int, list[str], list[tuple[str, int | None]], bool]
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be parsed or does not apply cleanly."""
+
+
+def apply_patch(original: str, patch: str) -> str:
+    r"""Apply a unified diff to `original` and return the patched text.
+
+    Lines added after a last line that had no newline start on a line of
+    their own:
+
+    >>> apply_patch("a\nb", "@@ -1,2 +1,3 @@\n a\n b\n+c\n")
+    'a\nb\nc\n'
+    >>> apply_patch("a\nb\n", "@@ -2 +2 @@\n-b\n+c\n\\ No newline at end of file\n")
+    'a\nc'
+    """
+    hunks = _parse_hunks(patch)
+    if not hunks:
+        raise PatchError("patch contains no hunks")
+
+    lines = original.splitlines(keepends=True)
+    eol = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+    out: list[str] = []
+    pos = 0
+    for hint, old, new, no_eol in hunks:
+        idx = _find_hunk(lines, old, pos, hint)
+        if idx is None:
+            raise PatchError(f"hunk at line {hint + 1} does not match the file")
+        out.extend(lines[pos:idx])
+        # Context lines keep the file's own text (line ending, trailing
+        # whitespace); added lines get the file's line ending
+        out.extend(text + eol if ctx is None else lines[idx + ctx] for text, ctx in new)
+        if no_eol and new:
+            out[-1] = out[-1].rstrip("\r\n")
+        pos = idx + len(old)
+    out.extend(lines[pos:])
+    # A line that ended the file without a newline may now have more after it
+    for i in range(len(out) - 1):
+        if not out[i].endswith("\n"):
+            out[i] += eol
+    return "".join(out)
+
+
+def _parse_hunks(patch: str) -> list[_Hunk]:
+    """Parse a unified diff into (start_hint, old_lines, new_lines, no_eol) tuples.
+
+    A hunk runs for as many old/new lines as its `@@` header promises, so a
+    removed "-- x" line is never taken for a "--- " file header. Past its
+    counts, diff lines still extend it (models often miscount) until a file
+    header, a line without a diff prefix, or the next `@@`.
+    """
+    hunks: list[_Hunk] = []
+    current: _Hunk | None = None
+    old_left = new_left = 0
+    last = ""
+    for raw in patch.splitlines():
+        m = _HUNK_RE.match(raw)
+        if m:
+            # "-N,0" is a pure insertion after line N; otherwise the hunk
+            # starts at line N (1-based)
+            start = int(m.group(1))
+            hint = start if m.group(2) == "0" else max(start - 1, 0)
+            old_left = int(m.group(2) or 1)
+            new_left = int(m.group(3) or 1)
+            current = (hint, [], [], False)
+            hunks.append(current)
+            last = ""
+            continue
+        if current is None:
+            continue  # file headers and commentary before/between hunks
+        if raw.startswith("\\"):
+            # "\ No newline at end of file" applies to the line before it
+            if last in ("+", " "):
+                hunks[-1] = current = current[:3] + (True,)
+            continue
+        if old_left <= 0 and new_left <= 0 and (
+            raw.startswith(("--- ", "+++ ", "diff ")) or not raw.startswith((" ", "-", "+"))
+        ):
+            current = None
+            continue
+        _, old, new, _ = current
+        if raw.startswith("-"):
+            old.append(raw[1:])
+            old_left -= 1
+            last = "-"
+        elif raw.startswith("+"):
+            new.append((raw[1:], None))
+            new_left -= 1
+            last = "+"
+        else:
+            # Context line; models often drop the leading space on blank lines
+            text = raw[1:] if raw.startswith(" ") else raw
+            new.append((text, len(old)))
+            old.append(text)
+            old_left -= 1
+            new_left -= 1
+            last = " "
+    return hunks
+
+
+def _find_hunk(lines: list[str], old: list[str], start: int, hint: int) -> int | None:
+    """Return the index in `lines` where `old` matches, nearest to `hint`."""
+    if not old:
+        return min(max(hint, start), len(lines))
+
+    for normalize in (lambda s: s.rstrip("\r\n"), lambda s: s.rstrip()):
+        norm = [normalize(s) for s in lines]
+        target = [normalize(s) for s in old]
+        matches = [
+            i for i in range(start, len(lines) - len(old) + 1)
+            if norm[i:i + len(old)] == target
+        ]
+        if matches:
+            return min(matches, key=lambda i: abs(i - hint))
+    return None
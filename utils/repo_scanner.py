@@ -4,7 +4,13 @@ Repo scanner — reads a target repository and builds a structured representatio
 
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import config
@@ -16,11 +22,23 @@ SKIP_DIRS = {
     ".pytest_cache", "site", ".tox", "dist", "build", "egg-info",
 }
 
+# Threads reading file contents during a scan (I/O-bound; overlaps disk waits)
+SCAN_READ_WORKERS = 16
 
-def scan_repo(repo_path: Path | str) -> dict:
+# Scans kept in memory, keyed on (resolved repo path, tree fingerprint)
+SCAN_CACHE_SIZE = 8
+_scan_cache: OrderedDict[tuple[str, str], dict] = OrderedDict()
+_scan_cache_lock = threading.Lock()
+
+
+def scan_repo(repo_path: Path | str, use_cache: bool = True) -> dict:
     """
     Scan a repository and return its structure + file contents.
 
+    With use_cache, a scan is reused (from memory, then from SCAN_CACHE_DIR)
+    as long as no file under the repo has been added, removed, resized or
+    touched since it was taken. The returned dict is shared; don't mutate it.
+
     Returns:
         {
             "tree": ["relative/path/to/file", ...],
@@ -34,81 +52,239 @@ def scan_repo(repo_path: Path | str) -> dict:
     if not repo_path.is_dir():
         raise ValueError(f"Repository path does not exist: {repo_path}")
 
-    tree: list[str] = []
+    # One directory walk serves both the fingerprint and, on a miss, the scan
+    entries = _walk(repo_path)
+    if not use_cache:
+        return _scan(repo_path, entries)
+
+    key = (str(repo_path.resolve()), _fingerprint(entries))
+    with _scan_cache_lock:
+        scan = _scan_cache.get(key)
+        if scan is not None:
+            _scan_cache.move_to_end(key)
+            log.info("Scan cache hit: %s", repo_path.name)
+            return scan
+
+    scan = _load_scan(key)
+    if scan is None:
+        scan = _scan(repo_path, entries)
+        _save_scan(key, scan)
+    else:
+        log.info("Scan cache hit (disk): %s", repo_path.name)
+
+    with _scan_cache_lock:
+        _scan_cache[key] = scan
+        while len(_scan_cache) > SCAN_CACHE_SIZE:
+            _scan_cache.popitem(last=False)
+    return scan
+
+
+def _scan(repo_path: Path, entries: list[tuple[str, os.DirEntry]]) -> dict:
+    """Read every analyzable file among the walked `entries`."""
+    tree = [rel for rel, _ in entries]
+    candidates = [
+        (rel, entry) for rel, entry in entries
+        if os.path.splitext(entry.name)[1].lower() in config.ANALYZABLE_EXTENSIONS
+    ]
+
+    def read(candidate: tuple[str, os.DirEntry]) -> dict | None:
+        rel, entry = candidate
+        return _read_file(Path(entry.path), rel)
+
+    # Reads run concurrently; results are gathered here in path order
     files: dict[str, dict] = {}
-    lang_counts: dict[str, int] = {}
-    total_lines = 0
+    with ThreadPoolExecutor(max_workers=SCAN_READ_WORKERS) as ex:
+        for (rel, _), info in zip(candidates, ex.map(read, candidates)):
+            if info is not None:
+                files[rel] = info
+
+    scan = {"tree": tree, "files": files, "stats": _stats(tree, files)}
+    log.info(
+        "Scanned %s: %d files, %d analyzable, %d total lines",
+        repo_path.name, len(tree), len(files), scan["stats"]["total_lines"],
+    )
+    return scan
 
-    for path in sorted(repo_path.rglob("*")):
-        # Skip hidden/ignored directories
-        if any(part in SKIP_DIRS for part in path.parts):
+
+def _walk(repo_path: Path) -> list[tuple[str, os.DirEntry]]:
+    """Every file under the repo as (relative path, DirEntry), in path order.
+
+    Ignored directories are pruned before they are entered, and the DirEntry
+    type info saves a separate is_file() call per path.
+    """
+    found: list[tuple[str, os.DirEntry]] = []
+    stack = [(str(repo_path), "")]
+    while stack:
+        dir_path, prefix = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError as e:
+            log.warning("Could not list %s: %s", dir_path, e)
             continue
+        for entry in entries:
+            rel = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIP_DIRS:
+                    stack.append((entry.path, rel + "/"))
+            elif entry.is_file():
+                found.append((rel, entry))
+    # Same order as sorting Path objects: component by component
+    found.sort(key=lambda item: item[0].split("/"))
+    return found
+
+
+def rescan_files(repo_path: Path | str, scan: dict, paths: list[str]) -> dict:
+    """Return a copy of `scan` with just `paths` (repo-relative) re-read.
+
+    For callers that already hold a scan and know exactly which files they
+    changed since, e.g. the pipeline after applying improvements. Paths that
+    no longer exist are dropped. The input scan is not modified.
+    """
+    repo_path = Path(repo_path)
+    tree = list(scan["tree"])
+    files = dict(scan["files"])
+    known = set(tree)
+    added = False
+
+    for rel in dict.fromkeys(paths):
+        path = repo_path / rel
+        files.pop(rel, None)
         if not path.is_file():
+            if rel in known:
+                tree.remove(rel)
+                known.discard(rel)
             continue
+        if rel not in known:
+            tree.append(rel)
+            known.add(rel)
+            added = True
+        info = _read_file(path, rel)
+        if info is not None:
+            files[rel] = info
 
-        rel = str(path.relative_to(repo_path))
-        ext = path.suffix.lower()
-
-        tree.append(rel)
-
-        if ext in config.ANALYZABLE_EXTENSIONS:
-            try:
-                content = path.read_text(errors="replace")
-                if len(content) > config.MAX_FILE_SIZE:
-                    content = content[:config.MAX_FILE_SIZE] + "\n... [TRUNCATED]"
-                lines = content.count("\n") + 1
-                total_lines += lines
-                files[rel] = {
-                    "content": content,
-                    "size": path.stat().st_size,
-                    "lines": lines,
-                    "ext": ext,
-                }
-                lang_counts[ext] = lang_counts.get(ext, 0) + lines
-            except Exception as e:
-                log.warning("Could not read %s: %s", rel, e)
+    if added:
+        tree.sort()
+    return {"tree": tree, "files": files, "stats": _stats(tree, files)}
+
+
+def _read_file(path: Path, rel: str) -> dict | None:
+    """Read one file into a scan entry, or None if it isn't analyzable.
+
+    Lines are counted on the raw bytes (whole file), and only the part kept
+    as content (up to MAX_FILE_SIZE bytes) is decoded.
+    """
+    ext = path.suffix.lower()
+    if ext not in config.ANALYZABLE_EXTENSIONS:
+        return None
+    try:
+        raw = path.read_bytes()
+        size = len(raw)
+        truncated = size > config.MAX_FILE_SIZE
+        content = raw[:config.MAX_FILE_SIZE].decode("utf-8", errors="replace")
+        if "\r" in content:
+            # Match text-mode reads (universal newlines)
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        if truncated:
+            content += "\n... [TRUNCATED]"
+        return {
+            "content": content,
+            "size": size,
+            "lines": raw.count(b"\n") + 1,
+            "ext": ext,
+        }
+    except Exception as e:
+        log.warning("Could not read %s: %s", rel, e)
+        return None
 
-    log.info(
-        "Scanned %s: %d files, %d analyzable, %d total lines",
-        repo_path.name, len(tree), len(files), total_lines,
-    )
 
+def _stats(tree: list[str], files: dict[str, dict]) -> dict:
+    lang_counts: dict[str, int] = {}
+    for info in files.values():
+        lang_counts[info["ext"]] = lang_counts.get(info["ext"], 0) + info["lines"]
     return {
-        "tree": tree,
-        "files": files,
-        "stats": {
-            "total_files": len(tree),
-            "analyzable_files": len(files),
-            "total_lines": total_lines,
-            "languages": lang_counts,
-        },
+        "total_files": len(tree),
+        "analyzable_files": len(files),
+        "total_lines": sum(lang_counts.values()),
+        "languages": lang_counts,
     }
 
 
+def _fingerprint(entries: list[tuple[str, os.DirEntry]]) -> str:
+    """Hash every walked file's path, size and mtime (stat only, no reads).
+
+    One DirEntry.stat() per file; the entry caches it. Also covers the
+    scanner settings, so changing them invalidates old scans.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((sorted(config.ANALYZABLE_EXTENSIONS), config.MAX_FILE_SIZE)).encode())
+    for rel, entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _scan_cache_path(key: tuple[str, str]) -> Path:
+    repo_hash = hashlib.blake2b(key[0].encode(), digest_size=10).hexdigest()
+    return config.SCAN_CACHE_DIR / f"{repo_hash}.json"
+
+
+def _load_scan(key: tuple[str, str]) -> dict | None:
+    """Load the persisted scan for a repo if its fingerprint still matches."""
+    try:
+        cached = json.loads(_scan_cache_path(key).read_text())
+    except (OSError, ValueError):
+        return None
+    if cached.get("fingerprint") != key[1]:
+        return None
+    return cached.get("scan")
+
+
+def _save_scan(key: tuple[str, str], scan: dict) -> None:
+    """Persist the latest scan for a repo (one file per repo, overwritten)."""
+    try:
+        config.SCAN_CACHE_DIR.mkdir(exist_ok=True)
+        _scan_cache_path(key).write_text(json.dumps({"fingerprint": key[1], "scan": scan}))
+    except OSError as e:
+        log.warning("Could not write scan cache for %s: %s", key[0], e)
+
+
 def build_tree_string(tree: list[str]) -> str:
-    """Build a visual tree string from a flat file list."""
-    lines = []
-    for path_str in tree:
-        parts = path_str.split("/")
-        indent = "  " * (len(parts) - 1)
-        lines.append(f"{indent}├── {parts[-1]}")
-    return "\n".join(lines)
+    """Build a visual tree string from a flat file list.
+
+    Depth and name come from count()/rpartition() on each path, so no
+    per-path component list is built.
+    """
+    return "\n".join(
+        f"{'  ' * path.count('/')}├── {path.rpartition('/')[2]}" for path in tree
+    )
 
 
-def build_file_summary(files: dict[str, dict], max_chars: int | None = None) -> str:
+def build_file_summary(
+    files: dict[str, dict], max_chars: int | None = None, filter_exts: set[str] | None = None,
+) -> str:
     """Build a concise summary of file contents, staying within a character budget.
     
     Prioritizes .py files over docs/config, and sorts by size (smallest first)
-    to maximize the number of files included.
+    to maximize the number of files included. If filter_exts is given, only
+    files with those extensions are included.
     """
     max_chars = max_chars or config.MAX_CONTEXT_CHARS
+    if filter_exts is not None:
+        files = {rel: info for rel, info in files.items() if info["ext"] in filter_exts}
 
-    # Prioritize: .py first, then .yml/.yaml, then everything else
+    # Prioritize: .py first, then .yml/.yaml, then everything else. With only
+    # four priorities, bucket first and sort each bucket by size.
     priority = {".py": 0, ".yml": 1, ".yaml": 1, ".sh": 2}
-    sorted_files = sorted(
-        files.items(),
-        key=lambda kv: (priority.get(kv[1]["ext"], 3), kv[1].get("lines", 0)),
-    )
+    buckets: list[list[tuple[str, dict]]] = [[], [], [], []]
+    for item in files.items():
+        buckets[priority.get(item[1]["ext"], 3)].append(item)
+    for bucket in buckets:
+        bucket.sort(key=lambda kv: kv[1].get("lines", 0))
+    sorted_files = [item for bucket in buckets for item in bucket]
 
     parts = []
     total = 0
@@ -0,0 +1,123 @@
+"""
+Run log — append-only JSON-lines record of an in-process pipeline run.
+
+Each step appends one `{"step": ..., "data": {...}}` line as it finishes, so a
+crashed run still leaves everything up to the failing step on disk. Reading
+a run folds the `data` of every line, in order, back into one run record.
+
+Next to each log sits a small `<run_id>.meta.json` with just the fields the
+run listing shows, so listing runs never has to parse the full logs.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import os
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback; same output, just slower
+    orjson = None  # type: ignore
+
+
+def _dumps(entry: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(entry, default=str)
+    return json.dumps(entry, default=str, separators=(",", ":")).encode()
+
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+META_SUFFIX = ".meta.json"
+META_FIELDS = ("run_id", "status", "started_at", "duration_sec")
+
+
+def append_entry(path: Path, step: str, data: dict) -> None:
+    """Append one step's fields to the run log at `path`."""
+    line = _dumps({"step": step, "data": data}) + b"\n"
+    with open(path, "ab") as f:
+        f.write(line)
+
+
+def save_run(path: Path, record: dict) -> None:
+    """Write a whole run record as one indented .json document."""
+    if orjson is not None:
+        data = orjson.dumps(record, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        data = json.dumps(record, indent=2, default=str).encode()
+    path.write_bytes(data)
+
+
+def load_run(path: Path) -> dict:
+    """Rebuild the run record from a .jsonl log (or a legacy .json dump)."""
+    if path.suffix != ".jsonl":
+        return _loads(path.read_bytes())
+
+    record: dict = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = _loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write; keep what came before
+                break
+            record.update(entry.get("data", {}))
+    return record
+
+
+def write_meta(runs_dir: Path, record: dict) -> None:
+    """Write (or replace) the listing summary for a run."""
+    meta = {key: record.get(key) for key in META_FIELDS}
+    meta["improvements"] = len(record.get("improvements", []))
+    path = runs_dir / f"{record['run_id']}{META_SUFFIX}"
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(_dumps(meta))
+    os.replace(tmp, path)
+
+
+def list_runs(runs_dir: Path, limit: int, status: str | None = None) -> list[dict]:
+    """Summaries of the newest `limit` runs in `runs_dir`, optionally by status.
+
+    Run ids start with a UTC timestamp, so newest-first is a reverse order on
+    file names (no stat calls). Without a status filter only the top `limit`
+    names are selected (heapq.nlargest) instead of sorting them all. Runs
+    without a .meta.json sidecar (e.g. older logs) fall back to parsing their
+    full log.
+    """
+    sources: dict[str, tuple[int, str]] = {}
+    with os.scandir(runs_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            # Lower rank wins: sidecar, then JSON-lines log, then legacy dump
+            for rank, suffix in enumerate((META_SUFFIX, ".jsonl", ".json")):
+                if name.endswith(suffix):
+                    run_id = name[: -len(suffix)]
+                    if run_id not in sources or rank < sources[run_id][0]:
+                        sources[run_id] = (rank, entry.path)
+                    break
+
+    # A status filter may skip entries, so it needs the full ordering
+    ordered = sorted(sources, reverse=True) if status else heapq.nlargest(limit, sources)
+
+    runs: list[dict] = []
+    for run_id in ordered:
+        if len(runs) >= limit:
+            break
+        rank, path = sources[run_id]
+        try:
+            if rank == 0:
+                summary = _loads(Path(path).read_bytes())
+            else:
+                data = load_run(Path(path))
+                summary = {key: data.get(key) for key in META_FIELDS}
+                summary["improvements"] = len(data.get("improvements", []))
+        except (OSError, ValueError):
+            continue
+        if status and summary.get("status") != status:
+            continue
+        runs.append(summary)
+    return runs
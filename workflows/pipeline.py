@@ -1,7 +1,7 @@
 """
 Temporal Workflow: Code Improvement Pipeline
 
-Orchestrates the full pipeline:
+Orchestrates the full pipeline (steps 1–2 and 5–6 run concurrently):
   1. Analyze repo → specification.md, graph.md, architecture.md
   2. Suggest improvements (features, security, compliance, integration)
   3. Log tasks as beads
@@ -16,13 +16,9 @@ Orchestrates the full pipeline:
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
-import time
-import uuid
-from dataclasses import asdict
-from datetime import datetime, timezone, timedelta
-from pathlib import Path
+from datetime import timedelta
 
 from temporalio import workflow
 
@@ -40,6 +36,7 @@ with workflow.unsafe.imports_passed_through():
     from activities.update_docs import update_docs
     from features.beads.tracker import BeadTracker
     import config
+    from utils.run_log import save_run, write_meta
 
 log = logging.getLogger(__name__)
 
@@ -54,32 +51,61 @@ class CodeImprovementPipeline:
 
     @workflow.run
     async def run(self, repo_path: str) -> dict:
-        run_id = f"run-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        # Workflow time and UUIDs (not datetime.now()/uuid4()) so replays see
+        # the same values; run_id and started_at share one timestamp
+        started = workflow.now()
+        run_id = f"run-{started.strftime('%Y%m%d-%H%M%S')}-{workflow.uuid4().hex[:6]}"
         log.info("Pipeline %s starting for %s", run_id, repo_path)
-        pipeline_start = time.monotonic()
 
         tracker = BeadTracker(run_id)
+        # Settings read once per run, so a run uses one consistent value
+        # (e.g. the merge threshold shown on the bead is the one applied)
         branch_name = f"{config.IMPROVEMENT_BRANCH_PREFIX}/{run_id}"
+        merge_threshold = config.AUTO_MERGE_THRESHOLD
         run_record: dict = {
             "run_id": run_id,
             "target_repo": repo_path,
             "branch_name": branch_name,
-            "started_at": datetime.now(timezone.utc).isoformat(),
+            "started_at": started.isoformat(),
             "status": "running",
         }
 
         try:
-            # ━━ Step 1: Analyze Repo ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-            bead = tracker.create("Analyze Repository", "analysis",
-                                  input_summary=f"Scanning {repo_path}")
-            tracker.start(bead)
-            analysis = await workflow.execute_activity(
-                analyze_repo, args=[repo_path],
-                start_to_close_timeout=timedelta(minutes=5),
-            )
-            tracker.complete(bead, output_summary=f"Generated 3 docs, {analysis['stats']['total_files']} files scanned",
-                           metadata={"stats": analysis["stats"]})
-            run_record["repo_analysis"] = analysis
+            # ━━ Steps 1 + 2: Analyze Repo, Suggest Improvements ━━━━━━━━
+            # Independent of each other (both only read the repo), so they
+            # run concurrently; each bead brackets its own activity. Docs
+            # are written after both, so suggestions see the same tree as
+            # the analysis.
+            async def analyze_step() -> dict:
+                bead = tracker.create("Analyze Repository", "analysis",
+                                      input_summary=f"Scanning {repo_path}")
+                tracker.start(bead)
+                analysis = await workflow.execute_activity(
+                    analyze_repo, args=[repo_path],
+                    start_to_close_timeout=timedelta(minutes=5),
+                )
+                tracker.complete(bead, output_summary=f"Generated 3 docs, {analysis['stats']['total_files']} files scanned",
+                               metadata={"stats": analysis["stats"]})
+                return analysis
+
+            async def suggest_step() -> list[dict]:
+                bead = tracker.create("Suggest Improvements", "suggestions",
+                                      input_summary="Analyzing for features, security, compliance, integration")
+                tracker.start(bead)
+                improvements = await workflow.execute_activity(
+                    suggest_improvements, args=[repo_path],
+                    start_to_close_timeout=timedelta(minutes=5),
+                )
+                tracker.complete(bead, output_summary=f"{len(improvements)} improvements suggested",
+                               metadata={"count": len(improvements)})
+                return improvements
+
+            analysis, improvements = await asyncio.gather(analyze_step(), suggest_step())
+            # The record (saved to disk and returned into workflow history)
+            # keeps metadata only for large outputs whose content is written
+            # to the repo anyway: docs here, test files in step 6
+            run_record["repo_analysis"] = {"stats": analysis["stats"]}
+            run_record["improvements"] = improvements
 
             # Write initial docs
             bead_docs = tracker.create("Write Initial Docs", "analysis",
@@ -91,28 +117,19 @@ class CodeImprovementPipeline:
             )
             tracker.complete(bead_docs, output_summary=f"Wrote {len(docs_written)} docs")
 
-            # ━━ Step 2: Suggest Improvements ━━━━━━━━━━━━━━━━━━━━━━━━━
-            bead = tracker.create("Suggest Improvements", "suggestions",
-                                  input_summary="Analyzing for features, security, compliance, integration")
-            tracker.start(bead)
-            improvements = await workflow.execute_activity(
-                suggest_improvements, args=[repo_path],
-                start_to_close_timeout=timedelta(minutes=5),
-            )
-            tracker.complete(bead, output_summary=f"{len(improvements)} improvements suggested",
-                           metadata={"count": len(improvements)})
-            run_record["improvements"] = improvements
-
             # ━━ Step 3: Log Tasks as Beads ━━━━━━━━━━━━━━━━━━━━━━━━━━━
+            task_beads = {}  # improvement id → its task bead
             for imp in improvements:
-                task_bead = tracker.create(
+                task_beads[imp["id"]] = tracker.create(
                     f"Task: {imp['title']}",
                     imp["category"],
                     input_summary=imp["description"],
+                    metadata={
+                        "improvement_id": imp["id"],
+                        "priority": imp.get("priority", "medium"),
+                        "files": imp.get("files_affected", []),
+                    },
                 )
-                task_bead.metadata["improvement_id"] = imp["id"]
-                task_bead.metadata["priority"] = imp.get("priority", "medium")
-                task_bead.metadata["files"] = imp.get("files_affected", [])
 
             # ━━ Step 4: Create Branch + Execute Changes ━━━━━━━━━━━━━━
             bead_branch = tracker.create("Create Branch", "git",
@@ -131,21 +148,24 @@ class CodeImprovementPipeline:
                 execute_changes, args=[repo_path, improvements],
                 start_to_close_timeout=timedelta(minutes=10),
             )
-            applied_count = sum(1 for c in applied_changes if c["status"] == "applied")
+            # One pass over the changes; reused for the task beads and PR body
+            applied: list[dict] = []
+            applied_ids: set[str] = set()
+            for c in applied_changes:
+                if c["status"] == "applied":
+                    applied.append(c)
+                    applied_ids.add(c["improvement_id"])
+            applied_count = len(applied)
             tracker.complete(bead, output_summary=f"{applied_count}/{len(applied_changes)} changes applied",
                            metadata={"applied": applied_count, "total": len(applied_changes)})
             run_record["code_changes"] = applied_changes
 
             # Mark task beads as completed
-            for tb in tracker.beads:
-                imp_id = tb.metadata.get("improvement_id")
-                if imp_id:
-                    applied = any(c["improvement_id"] == imp_id and c["status"] == "applied"
-                                 for c in applied_changes)
-                    if applied:
-                        tracker.complete(tb, output_summary="Changes applied")
-                    else:
-                        tracker.skip(tb, reason="No changes applied")
+            for imp_id, tb in task_beads.items():
+                if imp_id in applied_ids:
+                    tracker.complete(tb, output_summary="Changes applied")
+                else:
+                    tracker.skip(tb, reason="No changes applied")
 
             # Commit changes
             bead_commit = tracker.create("Commit Changes", "git",
@@ -158,44 +178,63 @@ class CodeImprovementPipeline:
             tracker.complete(bead_commit, output_summary=commit_result.get("sha", "no commit"),
                            metadata=commit_result)
 
-            # ━━ Step 5: Code Review ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-            bead = tracker.create("Code Review", "review",
-                                  input_summary=f"Reviewing {applied_count} changes")
-            tracker.start(bead)
-            review = await workflow.execute_activity(
-                review_changes, args=[repo_path, applied_changes],
-                start_to_close_timeout=timedelta(minutes=5),
-            )
-            score = review.get("overall_score", 0)
-            tracker.complete(bead, output_summary=f"Score: {score}/10 — {'PASS' if review.get('passed') else 'FAIL'}",
-                           metadata={"score": score, "passed": review.get("passed")})
-            run_record["review"] = review
+            # ━━ Steps 5 + 6: Code Review, Generate Tests ━━━━━━━━━━━━━
+            # Both read the committed changes and neither writes to the
+            # repo, so they run concurrently
+            async def review_step() -> dict:
+                bead = tracker.create("Code Review", "review",
+                                      input_summary=f"Reviewing {applied_count} changes")
+                tracker.start(bead)
+                review = await workflow.execute_activity(
+                    review_changes, args=[repo_path, applied_changes],
+                    start_to_close_timeout=timedelta(minutes=5),
+                )
+                score = review.get("overall_score", 0)
+                tracker.complete(bead, output_summary=f"Score: {score}/10 — {'PASS' if review.get('passed') else 'FAIL'}",
+                               metadata={"score": score, "passed": review.get("passed")})
+                return review
+
+            async def test_gen_step() -> list[dict]:
+                bead = tracker.create("Generate Tests", "testing",
+                                      input_summary="Generating tests in 4 groups")
+                tracker.start(bead)
+                test_files = await workflow.execute_activity(
+                    generate_tests, args=[repo_path, improvements, applied_changes],
+                    start_to_close_timeout=timedelta(minutes=10),
+                )
+                total_tests = sum(t["test_count"] for t in test_files)
+                tracker.complete(bead, output_summary=f"{total_tests} tests in {len(test_files)} groups",
+                               metadata={"total_tests": total_tests})
+                return test_files
 
-            # ━━ Step 6: Generate Tests ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-            bead = tracker.create("Generate Tests", "testing",
-                                  input_summary="Generating tests in 4 groups")
-            tracker.start(bead)
-            test_files = await workflow.execute_activity(
-                generate_tests, args=[repo_path, improvements, applied_changes],
-                start_to_close_timeout=timedelta(minutes=10),
-            )
+            review, test_files = await asyncio.gather(review_step(), test_gen_step())
+            score = review.get("overall_score", 0)
             total_tests = sum(t["test_count"] for t in test_files)
-            tracker.complete(bead, output_summary=f"{total_tests} tests in {len(test_files)} groups",
-                           metadata={"total_tests": total_tests})
-            run_record["tests_generated"] = test_files
+            run_record["review"] = review
+            run_record["tests_generated"] = [
+                {"group": t["group"], "file": t["file"], "test_count": t["test_count"]} for t in test_files
+            ]
 
             # ━━ Step 7: Execute Tests ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+            # A score below the threshold already rules out auto-merge, so
+            # the test files are only written (for the PR), not run
+            execute_tests = score >= merge_threshold or config.RUN_TESTS_ON_FAIL
             bead = tracker.create("Execute Tests", "testing",
                                   input_summary=f"Running {total_tests} tests")
             tracker.start(bead)
             test_results = await workflow.execute_activity(
-                run_tests, args=[repo_path, test_files],
+                run_tests, args=[repo_path, test_files, execute_tests],
                 start_to_close_timeout=timedelta(minutes=10),
             )
             total_passed = sum(r["passed"] for r in test_results)
             total_failed = sum(r["failed"] for r in test_results)
-            tracker.complete(bead, output_summary=f"{total_passed} passed, {total_failed} failed",
-                           metadata={"passed": total_passed, "failed": total_failed})
+            if execute_tests:
+                tracker.complete(bead, output_summary=f"{total_passed} passed, {total_failed} failed",
+                               metadata={"passed": total_passed, "failed": total_failed})
+                tests_line = f"{total_passed} passed, {total_failed} failed"
+            else:
+                tracker.skip(bead, reason=f"Review score {score} below threshold {merge_threshold}")
+                tests_line = "not run (review score below auto-merge threshold)"
             run_record["test_results"] = test_results
 
             # Commit test files
@@ -218,10 +257,9 @@ class CodeImprovementPipeline:
                 f"**Run ID:** `{run_id}`\n"
                 f"**Improvements Applied:** {applied_count}\n"
                 f"**Review Score:** {score}/10\n"
-                f"**Tests:** {total_passed} passed, {total_failed} failed\n\n"
+                f"**Tests:** {tests_line}\n\n"
                 f"### Changes\n" +
-                "\n".join(f"- [{c['improvement_id']}] {c['file']}: {c['diff_summary']}"
-                          for c in applied_changes if c["status"] == "applied")
+                "\n".join([f"- [{c['improvement_id']}] {c['file']}: {c['diff_summary']}" for c in applied])
             )
             pr_result = await workflow.execute_activity(
                 create_merge_request,
@@ -234,10 +272,10 @@ class CodeImprovementPipeline:
 
             # ━━ Step 8b: Auto-Merge ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             bead = tracker.create("Auto-Merge Decision", "git",
-                                  input_summary=f"Score {score} vs threshold {config.AUTO_MERGE_THRESHOLD}")
+                                  input_summary=f"Score {score} vs threshold {merge_threshold}")
             tracker.start(bead)
             merge_result = await workflow.execute_activity(
-                auto_merge, args=[repo_path, score],
+                auto_merge, args=[repo_path, score, merge_threshold, pr_result.get("url")],
                 start_to_close_timeout=timedelta(minutes=1),
             )
             tracker.complete(bead, output_summary=merge_result["status"],
@@ -252,28 +290,33 @@ class CodeImprovementPipeline:
                 )
 
             # ━━ Step 9: Update Docs ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-            bead = tracker.create("Update Documentation", "documentation",
-                                  input_summary="Regenerating specification.md, graph.md, architecture.md")
+            changed = [c["file"] for c in applied]
+            bead = tracker.create(
+                "Update Documentation", "documentation",
+                input_summary=(f"Re-analyzing after {len(changed)} changed files" if changed
+                               else "No changes applied; checking docs from step 1"),
+            )
             tracker.start(bead)
             updated_docs = await workflow.execute_activity(
-                update_docs, args=[repo_path],
+                update_docs, args=[repo_path, analysis, changed],
                 start_to_close_timeout=timedelta(minutes=5),
             )
             tracker.complete(bead, output_summary=f"Updated {len(updated_docs)} docs")
             run_record["docs_updated"] = updated_docs
 
-            # Commit updated docs
-            await workflow.execute_activity(
-                commit_changes, args=[repo_path, f"repo-pilot: update docs after improvements ({run_id})"],
-                start_to_close_timeout=timedelta(minutes=1),
-            )
-            # Push updated docs
-            if merge_result["status"] == "merged":
-                from activities.git_ops import _git
-                await workflow.execute_activity(
-                    _push_main, args=[repo_path],
+            # Commit + push updated docs. Without applied changes the docs
+            # match what step 1 wrote (and the first commit already holds),
+            # so skip both when no file actually changed.
+            if updated_docs:
+                docs_commit = await workflow.execute_activity(
+                    commit_changes, args=[repo_path, f"repo-pilot: update docs after improvements ({run_id})"],
                     start_to_close_timeout=timedelta(minutes=1),
                 )
+                if merge_result["status"] == "merged" and docs_commit["status"] == "committed":
+                    await workflow.execute_activity(
+                        _push_main, args=[repo_path],
+                        start_to_close_timeout=timedelta(minutes=1),
+                    )
 
             # ━━ Step 10: Final Logging ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             run_record["status"] = "completed"
@@ -284,11 +327,11 @@ class CodeImprovementPipeline:
             run_record["error"] = str(e)
 
         # Finalize
-        total_duration = round(time.monotonic() - pipeline_start, 2)
-        run_record["completed_at"] = datetime.now(timezone.utc).isoformat()
+        finished = workflow.now()
+        total_duration = round((finished - started).total_seconds(), 2)
+        run_record["completed_at"] = finished.isoformat()
         run_record["duration_sec"] = total_duration
-        run_record["beads"] = tracker.to_list()
-        run_record["bead_summary"] = tracker.summary()
+        run_record["beads"], run_record["bead_summary"] = tracker.finalize()
 
         # Save log file
         bead = tracker.create("Save Pipeline Log", "logging")
@@ -298,6 +341,9 @@ class CodeImprovementPipeline:
             start_to_close_timeout=timedelta(minutes=1),
         )
         tracker.complete(bead, output_summary=log_path)
+        # finalize() flushed before this bead existed; write it now rather
+        # than leaving it buffered in a long-lived worker
+        tracker.flush()
         run_record["log_file"] = log_path
 
         log.info("Pipeline %s complete in %.1fs — status: %s",
@@ -308,21 +354,12 @@ class CodeImprovementPipeline:
 # ── Helper activities (registered separately) ─────────────────────────
 
 def _write_analysis_docs(repo_path: str, analysis: dict) -> list[str]:
-    """Write the initial analysis docs to the repo."""
-    repo = Path(repo_path)
-    docs_dir = repo / "docs"
-    docs_dir.mkdir(exist_ok=True)
-    written = []
-    for name, key in [
-        ("specification.md", "specification"),
-        ("graph.md", "graph"),
-        ("architecture.md", "architecture"),
-    ]:
-        content = analysis.get(key, "")
-        if content:
-            (docs_dir / name).write_text(content)
-            written.append(f"docs/{name}")
-    return written
+    """Write the initial analysis docs to the repo.
+
+    Same writer as step 9: docs already holding this content are not
+    rewritten, so a re-run on an unchanged repo touches no files.
+    """
+    return update_docs(repo_path, analysis)
 
 
 def _push_main(repo_path: str) -> dict:
@@ -337,7 +374,7 @@ def _save_run_log(run_id: str, run_record: dict) -> str:
     runs_dir = config.PIPELINE_RUNS_DIR
     runs_dir.mkdir(exist_ok=True)
     file_path = runs_dir / f"{run_id}.json"
-    with open(file_path, "w") as f:
-        json.dump(run_record, f, indent=2, default=str)
+    save_run(file_path, run_record)
+    write_meta(runs_dir, run_record)
     log.info("Run log saved: %s", file_path)
     return str(file_path)